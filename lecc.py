@@ -1,342 +1,483 @@
 # -*- coding: utf-8 -*-
-import json
+import os
 import socket
-import requests
+import sys
 import threading
 import time
 import queue
-import serial
-from flask import Flask, request
-import io
-import paho.mqtt.client as mqtt
-import smbus2 as smbus
-from werkzeug.serving import make_server
-
-print()  # Espacio antes de LECC Universal System Complete
-print("\033[1mLECC Universal System Complete\033[0m")
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from lecc_pool import ConnectionPool
+from lecc_backends import DEFERRED, get_backend
+from lecc_codec import CODECS, EncodedMessage, get_codec
+from lecc_routing import RoutingTable
+from lecc_store import DurableQueue
+from lecc_queues import BoundedQueue
+from lecc_metrics import MetricsRegistry
+from lecc_rescue import RescueScheduler
+from lecc_scheduler import PriorityScheduler
+from lecc_breaker import CircuitBreaker, HealthProber
+from lecc_dedup import DedupCache
 
 class GenericModule:
     def __init__(self, protocol, config):
         self.protocol = protocol
         self.config = config
-        self.message_queue = queue.Queue()
-        self.failed_message_queue = queue.Queue()
+        # Bounded so a slow consumer or a long outage cannot exhaust memory; see lecc_queues.
+        # drop_oldest keeps the freshest readings without stalling the listeners behind the consumer
+        self.message_queue = BoundedQueue(config.get("queue_capacity", 10000),
+                                          config.get("queue_policy", "drop_oldest"), name=f"{protocol}-inbound")
+        # Store-and-forward backlog: past capacity it spills to disk instead of losing messages
+        self.failed_message_queue = BoundedQueue(config.get("failed_queue_capacity", 100000),
+                                                 config.get("failed_queue_policy", "spill"), name=f"{protocol}-failed")
         self.running = True
-        self.available = False
+        self._available = False
         self.core = None
-        self.failed_once = False
-        self.retry_attempts = 3
-        self.retry_delay = 2
+        # Availability follows the breaker: it opens after failure_threshold consecutive failures
+        self.breaker = CircuitBreaker(config.get("failure_threshold", 3), config.get("breaker_base_delay", 0.5),
+                                      config.get("breaker_max_delay", 30.0))
         self.emulated = False
         self.socket = None
         self.server_socket = None
-        self.emulated_messages = None
+        self.broker = None
         self.client = None
         self.connected = False
         self.serial = None
         self.bus = None
         self.app = None
         self.http_server = None
+        self.http_sender = None
+        self.datagram_sender = None
+        self.connections = set()
+        self.codec = get_codec(config.get("codec", "json"))
+        # Binary payloads may contain newlines, so they need length-prefixed frames
+        self.framing = config.get("framing", "length" if self.codec.binary else "newline")
+        # Transport behaviour comes from the backend registry; its optional
+        # libraries are only imported once this protocol actually uses them
+        self.backend = get_backend(protocol)(self)
+        self.transmit = self.backend.send
+
+    @property
+    def available(self):
+        return self._available
+
+    @available.setter
+    def available(self, value):
+        # Only real transitions are published, so the routing table is rebuilt per event, not per send
+        if value != self._available:
+            self._available = value
+            if self.core is not None:
+                self.core.on_availability_change(self, value)
 
     def init(self):
-        if self.protocol == "http":
-            self.app = Flask(__name__)
-            threading.Thread(target=self._run_http_server, daemon=True).start()
-            time.sleep(2)
-        elif self.protocol == "tcp":
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.config["host"], self.config["port"]))
-            self.server_socket.listen(5)
-            threading.Thread(target=self._listen_tcp, daemon=True).start()
-            time.sleep(1)
-        elif self.protocol == "udp":
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.bind((self.config["host"], self.config["port"]))
-            threading.Thread(target=self._listen_udp, daemon=True).start()
-            time.sleep(1)
-        elif self.protocol == "mqtt" and not self.emulated:
-            self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-            self.client.on_message = self.on_message
-            try:
-                self.client.connect(self.config["host"], self.config["port"])
-                self.client.subscribe(self.config["topic"])
-                self.client.loop_start()
-                self.connected = True
-            except Exception as e:
-                print(f"MQTT initialization error: {e}")
-        elif self.protocol == "i2c":
-            try:
-                self.bus = smbus.SMBus(1)
-                print("I2C initialized on bus 1")
-            except Exception:
-                print("I2C simulated (no hardware)")
-                self.bus = None
-        elif self.protocol == "uart":
-            try:
-                self.serial = serial.Serial("/dev/ttyUSB0", 9600, timeout=1)
-                print("UART initialized on /dev/ttyUSB0")
-            except Exception:
-                print("UART simulated (no hardware)")
-                self.serial = None
-
-    def send(self, message, silent=False):
-        if self.failed_once and self.retry_attempts <= 0 and not self.emulated:
+        self.backend.init()
+
+    def bind_socket(self, kind, host=None):
+        sock = socket.socket(socket.AF_INET, kind)
+        if kind == socket.SOCK_STREAM:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.config.get("reuse_port"):
+            # Worker processes share the port and the kernel spreads connections/datagrams across them
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host or self.config["host"], self.config["port"]))
+        return sock
+
+    def negotiate_codec(self, message):
+        accepted = message.get("accept_codecs")
+        if accepted is None or self.codec.name in accepted:
+            return self.codec
+        return get_codec("json")
+
+    def encode(self, message, encoded=None):
+        codec = self.negotiate_codec(message)
+        if encoded is None:
+            return codec.encode(message)
+        return encoded.render(codec, message.get("masked_history", []))
+
+    def send(self, message, silent=False, encoded=None):
+        if not self.breaker.closed:
+            # Skipped without touching the link; the prober closes the breaker once it answers again
             if not silent:
-                print(f"{self.protocol}: Failed to send, module permanently unavailable [UNAVAILABLE]")
+                print(f"{self.protocol}: Circuit open, message queued [UNAVAILABLE]")
+            self.short_circuited_total.inc()
             self.failed_message_queue.put(self.core.normalize_message(message))
             return
+        started = time.perf_counter()
+        try:
+            payload = self.encode(message, encoded)
+        except Exception as e:
+            # The message, not the link, is at fault: never charge it to the breaker
+            print(f"{self.protocol}: Dropped message that cannot be encoded - {e}")
+            self.encode_failures_total.inc()
+            return
         try:
-            combined_output = ""
-            if self.protocol == "uart":
-                if self.serial:
-                    self.serial.write(json.dumps(message).encode())
-                else:
-                    combined_output += f"UART/I2C simulated: {message['data']}"
-            elif self.protocol == "http":
-                response = requests.post(self.config["url"], json=message, timeout=5)
-                if response.status_code != 200:
-                    raise Exception(f"HTTP failure: {response.status_code}")
-                elif not self.core.http_printed:
-                    combined_output += " 200 OK"
-                    self.core.http_printed = True
-            elif self.protocol in ["tcp", "websocket", "ftp", "bluetooth", "zigbee"]:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
-                    client.connect((self.config["host"], self.config["port"]))
-                    client.send(json.dumps(message).encode())
-            elif self.protocol == "udp":
-                if not self.socket:
-                    raise Exception("UDP not initialized")
-                self.socket.sendto(json.dumps(message).encode(), (self.config["host"], self.config["port"]))
-            elif self.protocol == "mqtt":
-                if self.emulated:
-                    self.emulated_messages.put(json.dumps(message))
-                    if not silent:
-                        print(f"MQTT simulated: {message['data']}")
-                else:
-                    if not self.connected:
-                        raise Exception("MQTT not connected")
-                    self.client.publish(self.config["topic"], json.dumps(message))
-            elif self.protocol == "i2c":
-                if self.bus:
-                    data = json.dumps(message).encode()
-                    self.bus.write_i2c_block_data(self.config["address"], 0, list(data))
-                else:
-                    combined_output += f"UART/I2C simulated: {message['data']}"
-            elif self.protocol == "ethernet":
-                if not self.socket:
-                    raise Exception("Ethernet not initialized")
-                self.socket.sendto(json.dumps(message).encode(), (self.config["host"], self.config["port"]))
-            self.available = True
-            self.failed_once = False
-            self.retry_attempts = 3
-            if combined_output and not silent:
-                print(combined_output)
+            # Bound once per module: no per-message protocol dispatch
+            output = self.transmit(message, payload, silent)
+            if output is DEFERRED:
+                # Only queued: a success here would reset the breaker after every failed flush
+                return
+            self.record_success()
+            self.send_seconds.observe(time.perf_counter() - started)
+            self.sent_total.inc()
+            if output and not silent:
+                print(output)
         except Exception as e:
+            self.record_failure(e, [message], silent)
+
+    def record_success(self):
+        self.breaker.record_success()
+        self.available = True
+
+    def record_failure(self, error, messages, silent=False):
+        was_closed = self.breaker.closed
+        self.breaker.record_failure()
+        if not self.breaker.closed:
             self.available = False
-            if not self.failed_once and not silent:
-                print(f"{self.protocol}: Failure '{e}' [UNAVAILABLE]")
-            self.failed_once = True
-            self.retry_attempts -= 1
+            if was_closed and not silent:
+                print(f"{self.protocol}: Failure '{error}' [UNAVAILABLE]")
+        self.send_failures_total.inc(len(messages))
+        for message in messages:
             self.failed_message_queue.put(self.core.normalize_message(message))
 
+    def note_received(self, message):
+        self.received_total.inc()
+        created_at = message.get("created_at") if isinstance(message, dict) else None
+        if created_at:
+            self.receive_latency.observe(max(0.0, time.time() - created_at))
+
+    def deliver(self, message, timeout=None):
+        """Hand a decoded inbound message to the consumer queue"""
+        self.note_received(message)
+        self.message_queue.put(message, timeout=timeout)
+
     def receive(self):
         try:
             return self.message_queue.get_nowait()
         except queue.Empty:
             return None
 
+    def probe(self):
+        """Out-of-band health check: reaches the endpoint without sending a message through it"""
+        return self.backend.probe(self.config.get("probe_timeout", 1.0))
+
     def test_availability(self):
-        attempt = 0
-        while attempt < self.retry_attempts:
+        attempts = self.breaker.failure_threshold
+        for attempt in range(1, attempts + 1):
             try:
-                self.send({"data": f"test_{self.protocol}", "destination_protocol": self.protocol}, silent=True)
-                self.available = True
-                self.emulated = False
-                break
+                healthy = self.probe()
+                error = "no response"
             except Exception as e:
-                attempt += 1
-                if attempt == self.retry_attempts:
-                    print(f"[✗] {self.protocol} unavailable after {self.retry_attempts} attempts - {e}, activating emulator")
-                    self.emulated = True
-                    self.core.emulate_module(self)
-                else:
-                    print(f"{self.protocol}: Attempt {attempt}/{self.retry_attempts} failed - {e}, retrying in {self.retry_delay}s")
-                    time.sleep(self.retry_delay)
+                healthy = False
+                error = e
+            if healthy:
+                self.record_success()
+                return True
+            if attempt == attempts:
+                print(f"[✗] {self.protocol} unavailable after {attempts} attempts - {error}, activating emulator")
+                self.emulated = True
+                self.core.emulate_module(self)
+                return False
+            delay = self.breaker.backoff(attempt)
+            print(f"{self.protocol}: Attempt {attempt}/{attempts} failed - {error}, retrying in {delay:.1f}s")
+            time.sleep(delay)
 
     def start_emulator(self):
-        if self.protocol in ["tcp", "websocket", "ftp", "bluetooth", "zigbee"]:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.config["host"], self.config["port"]))
-            self.server_socket.listen(5)
-            print(f"[✓] {self.protocol} emulated at {self.config['host']}:{self.config['port']}")
-            threading.Thread(target=self._emulator_server, daemon=True).start()
-        elif self.protocol == "udp":
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.bind((self.config["host"], self.config["port"]))
-            print(f"[✓] {self.protocol} emulated at {self.config['host']}:{self.config['port']}")
-            threading.Thread(target=self._listen_udp, daemon=True).start()
-        elif self.protocol == "mqtt":
-            self.connected = True
-            self.emulated_messages = queue.Queue()
-            print(f"[✓] {self.protocol} emulated at {self.config['host']}:{self.config['port']}")
-            threading.Thread(target=self._mqtt_emulator, daemon=True).start()
-        elif self.protocol == "ethernet":
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.bind((self.config["host"], self.config["port"]))
-            print(f"[✓] {self.protocol} emulated at {self.config['host']}:{self.config['port']}")
-            threading.Thread(target=self._listen_ethernet, daemon=True).start()
+        self.backend.start_emulator()
         self.emulated = True
+        self.breaker.reset()
         self.available = True
-        self.failed_once = False
-        self.retry_attempts = 3
 
-    def _emulator_server(self):
-        while self.running:
-            conn, addr = self.server_socket.accept()
-            data = conn.recv(1024).decode()
-            if data:
-                self.message_queue.put(json.loads(data))
-            conn.close()
-
-    def _mqtt_emulator(self):
-        while self.running:
-            if not self.emulated_messages.empty():
-                msg = self.emulated_messages.get()
-                self.message_queue.put(json.loads(msg))
-            time.sleep(0.1)
-
-    def _run_http_server(self):
-        @self.app.route("/api/data", methods=["POST"])
-        def receive_data():
-            data = request.json
-            self.message_queue.put(data)
-            return {"status": "success"}
-        print(f"Starting HTTP server: Running on all addresses (0.0.0.0) ||| http://127.0.0.1:{self.config['port']} ||| http://192.168.1.14:{self.config['port']}")
-        self.http_server = make_server("0.0.0.0", self.config["port"], self.app, threaded=True)
-        self.http_server.serve_forever()
-
-    def _listen_tcp(self):
-        while self.running:
-            conn, addr = self.server_socket.accept()
-            data = conn.recv(1024).decode()
-            if data:
-                self.message_queue.put(json.loads(data))
-            conn.close()
-
-    def _listen_udp(self):
-        while self.running:
-            data, _ = self.socket.recvfrom(1024)
-            self.message_queue.put(json.loads(data.decode()))
-
-    def _listen_ethernet(self):
-        while self.running:
-            data, _ = self.socket.recvfrom(1024)
-            self.message_queue.put(json.loads(data.decode()))
-
-    def on_message(self, client, userdata, msg):
-        self.message_queue.put(json.loads(msg.payload.decode()))
+    def close_endpoint(self):
+        """Stop listening and drop open connections, e.g. to take a link down"""
+        self.backend.close_endpoint()
 
     def _listen(self):
-        while self.running and self.available:
-            msg = self.receive()
-            if msg:
+        # Keeps consuming while the module is down; route_message drops echoes and loops
+        while self.running:
+            # Block until a listener delivers something instead of polling
+            try:
+                msg = self.message_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
                 print(f"{self.protocol}: Received '{msg['data']}'")
                 self.core.route_message(msg, self.protocol)
-            time.sleep(0.01)
+            except Exception as e:
+                # One bad message must not end the consumer for good
+                print(f"{self.protocol}: Failed to route received message - {e}")
 
 class LECCCore:
-    def __init__(self):
+    def __init__(self, store_dir=None, node_id=None, rescue_batch_size=256, rescue_rate=1000.0, rescue_rates=None):
         self.modules = {}
+        # When set, failed messages survive restarts in a per-protocol DurableQueue
+        self.store_dir = store_dir
         self.running = True
         self.maskpert_protocols = ["http", "tcp"]
+        # Every fan-out copy keeps its message ID, so a listener receiving one routes it only once
+        self.dedup = DedupCache()
+        self.max_hops = 8
+        self.node_id = node_id or uuid.uuid4().hex
         self.http_printed = False
+        self.connection_pool = ConnectionPool()
+        self.routing_table = RoutingTable()
+        self.routes_changed = threading.Event()
+        self.route_lock = threading.Lock()
+        self.availability_listeners = []
+        # Modules start in parallel; waiters are woken on every startup or availability event
+        self.startup = {}
+        self.startup_pool = ThreadPoolExecutor(thread_name_prefix="lecc-startup")
+        self.state_changed = threading.Condition()
+        self.metrics = MetricsRegistry()
+        self.down_since = {}
+        self.prober = HealthProber(self)
+        threading.Thread(target=self.prober.run, daemon=True).start()
+        # Backlog drains: batch size, default messages/s per fallback target, per-target overrides
+        self.rescue = RescueScheduler(self, batch_size=rescue_batch_size, rate=rescue_rate, rates=rescue_rates)
+        threading.Thread(target=self._maskpert_rescue, daemon=True).start()
+        # Routed messages wait here so scarce bandwidth goes to the most important class first
+        self.scheduler = PriorityScheduler()
+        self.metrics.gauge("lecc_scheduler_queue_depth", "Routed messages waiting for dispatch", self.scheduler.qsize)
+        self.metrics.gauge("lecc_dedup_entries", "Message IDs held by the dedup cache", lambda: len(self.dedup))
+        threading.Thread(target=self._dispatch, daemon=True).start()
 
-    def register_module(self, protocol, module):
+    def on_availability_change(self, module, available):
+        """Apply one availability event to the routing table and publish the new snapshot"""
+        with self.route_lock:
+            previous = self.routing_table
+            # Current flags, not the event's value: a later event may already have flipped this module
+            # back, and the last table published under the lock must match the modules as they are now
+            live = {p: m for p, m in self.modules.items() if m.available}
+            self.routing_table = RoutingTable(previous.version + 1, live,
+                                              self.compute_routes(live, module.protocol, previous))
+        self.routes_changed.set()
+        self._record_transition(module.protocol, available)
+        for listener in self.availability_listeners:
+            listener(module, available)
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+    def _record_transition(self, protocol, available):
+        now = time.time()
+        if not available:
+            self.down_since[protocol] = now
+            self.metrics.counter("lecc_failovers_total", "Transitions to unavailable", protocol=protocol).inc()
+            self.metrics.gauge("lecc_last_failover_timestamp_seconds", "When the module last became unavailable",
+                               protocol=protocol).set(now)
+            return
+        self.metrics.counter("lecc_recoveries_total", "Transitions back to available", protocol=protocol).inc()
+        self.metrics.gauge("lecc_last_recovery_timestamp_seconds", "When the module last became available",
+                           protocol=protocol).set(now)
+        down_since = self.down_since.pop(protocol, None)
+        if down_since is not None:
+            self.metrics.histogram("lecc_outage_seconds", "How long a module stayed unavailable",
+                                   protocol=protocol).observe(now - down_since)
+
+    def rebuild_routes(self):
+        """Recompute the whole routing table, e.g. after roles or rules change"""
+        with self.route_lock:
+            live = {p: m for p, m in self.modules.items() if m.available}
+            self.routing_table = RoutingTable(self.routing_table.version + 1, live,
+                                              self.compute_routes(live, None, None))
+        self.routes_changed.set()
+
+    def compute_routes(self, live, changed, previous):
+        """Role -> ordered live targets; the plain core has no roles"""
+        return {}
+
+    def attach_module(self, protocol, module):
         self.modules[protocol] = module
         module.core = self
+        if self.store_dir:
+            module.failed_message_queue = DurableQueue(os.path.join(self.store_dir, protocol))
+            module.message_queue.set_spill_dir(os.path.join(self.store_dir, f"{protocol}-inbound-spill"))
+        self.instrument_module(protocol, module)
+
+    def instrument_module(self, protocol, module):
+        metrics = self.metrics
+        module.send_seconds = metrics.histogram("lecc_send_seconds", "Time spent in a successful send", protocol=protocol)
+        module.sent_total = metrics.counter("lecc_messages_sent_total", "Messages sent", protocol=protocol)
+        module.send_failures_total = metrics.counter("lecc_send_failures_total", "Messages whose send failed", protocol=protocol)
+        module.encode_failures_total = metrics.counter("lecc_encode_failures_total", "Messages dropped because they could not be encoded",
+                                                       protocol=protocol)
+        module.short_circuited_total = metrics.counter("lecc_short_circuited_total", "Messages queued without a send because the breaker was open",
+                                                       protocol=protocol)
+        module.received_total = metrics.counter("lecc_messages_received_total", "Messages delivered by listeners", protocol=protocol)
+        module.receive_latency = metrics.histogram("lecc_receive_latency_seconds", "Age of a message when a listener delivers it", protocol=protocol)
+        metrics.gauge("lecc_module_available", "1 while the module is available", lambda: int(module.available), protocol=protocol)
+        metrics.gauge("lecc_breaker_open", "1 while the module's circuit breaker is open or half-open",
+                      lambda: int(not module.breaker.closed), protocol=protocol)
+        metrics.gauge("lecc_queue_depth", "Messages waiting in a module queue", lambda: module.message_queue.qsize(),
+                      protocol=protocol, queue="inbound")
+        metrics.gauge("lecc_queue_depth", "Messages waiting in a module queue", lambda: module.failed_message_queue.qsize(),
+                      protocol=protocol, queue="failed")
+        for queue_name, attr in (("inbound", "message_queue"), ("failed", "failed_message_queue")):
+            for policy in ("dropped_oldest", "dropped_newest", "delayed", "spilled"):
+                # A DurableQueue (LECC_STORE_DIR) has no overload policy and reads 0
+                metrics.counter(f"lecc_queue_{policy}_total", f"Messages {policy.replace('_', ' ')} by a queue's overload policy",
+                                lambda policy=policy, attr=attr: getattr(getattr(module, attr), policy, 0),
+                                protocol=protocol, queue=queue_name)
+
+    def register_module(self, protocol, module):
+        """Attach a module and start it in the background; returns the startup future"""
+        self.attach_module(protocol, module)
         threading.Thread(target=module._listen, daemon=True).start()
-        module.init()
+        return self.start_module(module, self._start_module)
+
+    def _start_module(self, module):
+        self.open_endpoint(module)
         module.test_availability()
 
+    def start_module(self, module, start):
+        future = self.startup_pool.submit(start, module)
+        self.startup[module.protocol] = future
+        future.add_done_callback(self._startup_done)
+        return future
+
+    def _startup_done(self, future):
+        error = future.exception()
+        if error is not None:
+            print(f"Module startup failed: {error}")
+        with self.state_changed:
+            self.state_changed.notify_all()
+
+    def startup_complete(self):
+        return all(future.done() for future in self.startup.values())
+
+    def wait_until(self, predicate, timeout=None):
+        """Block until predicate() holds, re-checking on every startup or availability event"""
+        with self.state_changed:
+            return self.state_changed.wait_for(predicate, timeout)
+
+    def wait_ready(self, timeout=None):
+        """Wait for every registered module to finish init and its availability probe"""
+        wait(list(self.startup.values()), timeout)
+        return self.startup_complete()
+
     def emulate_module(self, module):
         module.start_emulator()
 
+    def close_endpoint(self, protocol):
+        """Take a module's listener down; sends to it fail until reopen_endpoint"""
+        self.modules[protocol].close_endpoint()
+
+    def open_endpoint(self, module):
+        if module.emulated:
+            module.start_emulator()
+        else:
+            module.init()
+
+    def reopen_endpoint(self, protocol):
+        """Bring a closed endpoint back and probe it now instead of waiting for the breaker backoff"""
+        module = self.modules[protocol]
+        self.open_endpoint(module)
+        self.prober.check(module)
+
     def normalize_message(self, message):
         msg = message.copy() if isinstance(message, dict) else {"data": str(message)}
         msg.setdefault("protocol", "unknown")
         msg.setdefault("destination_protocol", "broadcast")
-        msg.setdefault("masked_history", [])
+        # Own list per copy: fan-out copies must not append to each other's history
+        msg["masked_history"] = list(msg.get("masked_history", []))
+        msg.setdefault("id", uuid.uuid4().hex)
+        msg.setdefault("hops", 0)
+        # Codec negotiation: what the message arrived in and what its origin accepts
+        msg.setdefault("codec", "json")
+        msg.setdefault("accept_codecs", list(CODECS))
+        # Origin timestamp, used for end-to-end receive latency
+        msg.setdefault("created_at", time.time())
         return msg
 
     def route_message(self, message, source_protocol=None):
         msg = self.normalize_message(message)
         if source_protocol:
             msg["protocol"] = source_protocol
+        # Worker processes of one gateway share node_id, so echoes of each other's fan-out are dropped too
+        echo = msg["hops"] > 0 and msg.get("origin") == self.node_id
+        if self.dedup.seen(msg["id"]) or echo:
+            self.metrics.counter("lecc_duplicates_dropped_total", "Routed messages dropped as already seen",
+                                 protocol=msg["protocol"]).inc()
+            return
+        msg.setdefault("origin", self.node_id)
+        msg["hops"] += 1
+        if msg["hops"] > self.max_hops:
+            print(f"{msg['protocol']}: Dropped message {msg['id']} after {self.max_hops} hops")
+            self.metrics.counter("lecc_hop_limit_dropped_total", "Routed messages dropped at the hop limit",
+                                 protocol=msg["protocol"]).inc()
+            return
         print(f"Sending from {msg['protocol']}: {msg['data']}")
         self.http_printed = False
-        self.maskpert_send(msg)
+        traffic_class = self.traffic_class(msg)
+        if not self.scheduler.put(msg, traffic_class):
+            # Class queue limit reached: park it for the rescue scheduler instead of losing it
+            print(f"{msg['protocol']}: {traffic_class or self.scheduler.default_class} queue full, deferring message")
+            if msg["protocol"] in self.modules:
+                self.modules[msg["protocol"]].failed_message_queue.put(msg)
+
+    def protocol_class(self, protocol):
+        """Scheduling class for traffic from a protocol; the plain core has a single class"""
+        return None
+
+    def traffic_class(self, message):
+        return self.protocol_class(message.get("protocol"))
+
+    def _dispatch(self):
+        while self.running:
+            entry = self.scheduler.get(timeout=0.5)
+            if entry is None:
+                continue
+            msg, _ = entry
+            started = time.perf_counter()
+            try:
+                self.maskpert_send(msg)
+                self.metrics.histogram("lecc_route_seconds", "Time to fan a routed message out to every live module",
+                                       protocol=msg["protocol"]).observe(time.perf_counter() - started)
+            except Exception as e:
+                print(f"Failed to dispatch message from {msg['protocol']}: {e}")
 
     def maskpert_send(self, message):
-        available_modules = {p: m for p, m in self.modules.items() if m.available}
+        available_modules = self.routing_table.modules
+        # Encode the body once per codec for the whole fan-out
+        encoded = EncodedMessage(message)
         sent_protocols = []
         for protocol in available_modules:
             try:
-                adapted_msg = message.copy()
-                adapted_msg["masked_history"].append(f"via_{protocol}")
-                available_modules[protocol].send(adapted_msg, silent=True)
+                adapted_msg = dict(message, masked_history=message["masked_history"] + [f"via_{protocol}"])
+                available_modules[protocol].send(adapted_msg, silent=True, encoded=encoded)
                 sent_protocols.append(protocol)
             except Exception as e:
                 print(f"Failed to send via {protocol}: {e}")
-                available_modules[protocol].available = False
-                available_modules[protocol].failed_once = True
+                available_modules[protocol].record_failure(e, [adapted_msg], silent=True)
         for maskpert_protocol in self.maskpert_protocols:
             if maskpert_protocol in available_modules and available_modules[maskpert_protocol].available:
                 try:
-                    adapted_msg = message.copy()
-                    adapted_msg["masked_history"].append(f"maskpert_{maskpert_protocol}")
-                    available_modules[maskpert_protocol].send(adapted_msg, silent=True)
+                    adapted_msg = dict(message, masked_history=message["masked_history"] + [f"maskpert_{maskpert_protocol}"])
+                    available_modules[maskpert_protocol].send(adapted_msg, silent=True, encoded=encoded)
                     print(f"\nSent with maskpert via {', '.join(sent_protocols)}, success with {maskpert_protocol}")
                     return
                 except Exception as e:
                     print(f"Failed to send with maskpert via {maskpert_protocol}: {e}")
-                    available_modules[maskpert_protocol].available = False
-                    available_modules[maskpert_protocol].failed_once = True
+                    available_modules[maskpert_protocol].record_failure(e, [adapted_msg], silent=True)
+
+    def rescue_targets(self, protocol):
+        """Where a protocol's failed messages should go: itself once it is back, else a maskpert protocol"""
+        if self.modules[protocol].available:
+            return [protocol]
+        return [p for p in self.maskpert_protocols if p in self.routing_table.modules]
 
     def _maskpert_rescue(self):
-        while self.running:
-            for protocol, module in self.modules.items():
-                if not module.available and not module.failed_message_queue.empty():
-                    while not module.failed_message_queue.empty():
-                        failed_msg = module.failed_message_queue.get()
-                        print(f"Rescuing message from {protocol} with maskpert: {failed_msg['data']}")
-                        available_maskpert = {p: m for p, m in self.modules.items() if m.available and p in self.maskpert_protocols}
-                        sent_protocols = []
-                        for maskpert_protocol in available_maskpert:
-                            try:
-                                adapted_msg = failed_msg.copy()
-                                adapted_msg["masked_history"].append(f"maskpert_{maskpert_protocol}")
-                                available_maskpert[maskpert_protocol].send(adapted_msg, silent=True)
-                                sent_protocols.append(maskpert_protocol)
-                                print(f"Sent with maskpert via {', '.join(sent_protocols)}, success with {maskpert_protocol}")
-                                break
-                            except Exception as e:
-                                print(f"Failed to send with maskpert via {maskpert_protocol}: {e}")
-                                available_maskpert[maskpert_protocol].available = False
-                                available_maskpert[maskpert_protocol].failed_once = True
-            time.sleep(5)
+        # Batched, rate-limited drains that start as soon as a fallback becomes available
+        self.rescue.run()
 
 # Configuration of protocols
 protocol_configs = {
-    "uart": {"port": None, "host": None},
-    "http": {"port": 5000, "host": "localhost", "url": "http://localhost:5000/api/data"},
+    "uart": {"port": None, "host": None, "codec": "binary"},
+    "http": {"port": 5000, "host": "localhost", "url": "http://localhost:5000/api/data", "batch_url": "http://localhost:5000/api/data/batch"},
     "tcp": {"port": 65433, "host": "127.0.0.1"},
-    "udp": {"port": 65434, "host": "127.0.0.1"},
+    "udp": {"port": 65434, "host": "127.0.0.1", "codec": "binary"},
     "websocket": {"port": 8765, "host": "localhost"},
     "ftp": {"port": 2121, "host": "localhost"},
     "mqtt": {"port": 1883, "host": "localhost", "topic": "lecc/data"},
-    "i2c": {"port": None, "host": None, "address": 0x48},
+    "i2c": {"port": None, "host": None, "address": 0x48, "codec": "binary"},
     "ethernet": {"port": 65435, "host": "127.0.0.1"},
     "bluetooth": {"port": 9999, "host": "localhost"},
     "zigbee": {"port": 8888, "host": "localhost"}
@@ -344,13 +485,24 @@ protocol_configs = {
 
 def main():
     global core
-    core = LECCCore()
+    print()  # Espacio antes de LECC Universal System Complete
+    print("\033[1mLECC Universal System Complete\033[0m")
+    # Set LECC_STORE_DIR to keep failed messages on disk across restarts
+    store_dir = os.environ.get("LECC_STORE_DIR")
+    if "--async" in sys.argv:
+        from lecc_async import AsyncLECCCore
+        core = AsyncLECCCore(store_dir=store_dir)
+    else:
+        core = LECCCore(store_dir=store_dir)
     for protocol, config in protocol_configs.items():
         core.register_module(protocol, GenericModule(protocol, config))
 
     print("\033[1mInitializing...\033[0m")
     print()  # Espacio antes de Initializing...
-    time.sleep(15)
+    # Modules start in parallel; LECC_STARTUP_DEADLINE caps how long to wait for all of them
+    if not core.wait_ready(float(os.environ.get("LECC_STARTUP_DEADLINE", 15))):
+        pending = [p for p, future in core.startup.items() if not future.done()]
+        print(f"Startup deadline reached, still starting: {pending}")
 
     available_protocols = [p for p, m in core.modules.items() if m.available]
     print(f"\033[1mAvailable ({len(available_protocols)}): {available_protocols}\033[0m")
@@ -364,8 +516,11 @@ def main():
     except KeyboardInterrupt:
         print("\nStopping system...")
         core.running = False
+        core.connection_pool.close()
         for module in core.modules.values():
             module.running = False
+            module.message_queue.close()
+            module.failed_message_queue.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import json
+import queue
+import socket
+import threading
+
+from lecc import LECCCore
+from lecc_framing import MAX_FRAME, StreamDecoder, unpack_datagram
+from lecc_codec import decode_batch, decode_message
+
+# Endpoints owned by the event loop instead of per-socket listener threads
+STREAM_PROTOCOLS = ["tcp", "websocket", "ftp", "bluetooth", "zigbee"]
+DATAGRAM_PROTOCOLS = ["udp", "ethernet"]
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                501: "Not Implemented",
+                503: "Service Unavailable"}
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, engine, module):
+        self.engine = engine
+        self.module = module
+
+    def datagram_received(self, data, addr):
+        self.engine.deliver_nowait(self.module, data)
+
+
+class AsyncEngine:
+    """Event loop thread that owns every TCP/UDP/HTTP endpoint of a core"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = None
+        # Listening servers and datagram transports, plus open stream writers, per protocol
+        self.servers = {}
+        self.connections = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self.ready.set)
+        self.loop.run_forever()
+
+    def stop(self):
+        for server in self.servers.values():
+            self.loop.call_soon_threadsafe(server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, coro):
+        """Run a coroutine on the engine loop from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def open_endpoint(self, module):
+        """Bind the module's endpoint on the loop; blocks until it is listening"""
+        self.submit(self._open_endpoint(module)).result()
+
+    def close_endpoint(self, module):
+        """Stop the module's endpoint and drop its open connections"""
+        self.submit(self._close_endpoint(module)).result()
+
+    def _decode(self, module, data, batch):
+        try:
+            if batch:
+                return decode_batch(data)
+            # Datagrams may carry several packed messages
+            return [decode_message(payload) for payload in unpack_datagram(data)]
+        except ValueError as e:
+            print(f"{module.protocol}: Dropped undecodable payload - {e}")
+            return None
+
+    def deliver_nowait(self, module, data, batch=False):
+        """Decode raw bytes on the loop and queue them for the module's consumer without waiting.
+
+        Datagrams cannot be pushed back, so with the block policy a full queue drops the newest.
+        """
+        messages = self._decode(module, data, batch)
+        if messages is None:
+            return False
+        for message in messages:
+            module.note_received(message)
+            try:
+                module.message_queue.put_nowait(message)
+            except queue.Full:
+                module.message_queue.note_dropped()
+        return True
+
+    async def deliver(self, module, data, batch=False, timeout=None):
+        """Like deliver_nowait, but with the block policy a full queue stalls the caller.
+
+        The wait runs off the loop: a stream reader stops reading, so TCP pushes back on
+        the sender; with a timeout, queue.Full is raised once it expires (HTTP answers 503).
+        """
+        messages = self._decode(module, data, batch)
+        if messages is None:
+            return False
+        for message in messages:
+            module.note_received(message)
+            try:
+                # drop_oldest, drop_newest and spill never raise here
+                module.message_queue.put_nowait(message)
+            except queue.Full:
+                await self.loop.run_in_executor(None, functools.partial(module.message_queue.put, message,
+                                                                        timeout=timeout))
+        return True
+
+    async def _open_endpoint(self, module):
+        host, port = module.config["host"], module.config["port"]
+        if module.protocol in STREAM_PROTOCOLS:
+            server = await asyncio.start_server(
+                lambda r, w: self._handle_stream(module, r, w), host, port, reuse_address=True,
+                reuse_port=module.config.get("reuse_port"))
+            module.server_socket = server.sockets[0]
+        elif module.protocol in DATAGRAM_PROTOCOLS:
+            sock = module.bind_socket(socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            server, _ = await self.loop.create_datagram_endpoint(lambda: _DatagramProtocol(self, module), sock=sock)
+            # send() keeps using the bound socket directly
+            module.socket = sock
+        elif module.protocol == "http":
+            print(f"Starting HTTP server: Running on all addresses (0.0.0.0) ||| http://127.0.0.1:{port} ||| http://192.168.1.14:{port}")
+            server = await asyncio.start_server(
+                lambda r, w: self._handle_http(module, r, w), "0.0.0.0", port, reuse_address=True,
+                reuse_port=module.config.get("reuse_port"))
+            module.http_server = server
+        else:
+            raise ValueError(f"{module.protocol} is not served by the async engine")
+        self.servers[module.protocol] = server
+
+    async def _close_endpoint(self, module):
+        server = self.servers.pop(module.protocol, None)
+        if server is not None:
+            server.close()
+        for writer in list(self.connections.pop(module.protocol, ())):
+            writer.close()
+        if isinstance(server, asyncio.AbstractServer):
+            await server.wait_closed()
+        module.server_socket = None
+        module.socket = None
+        module.http_server = None
+
+    def _track(self, module, writer):
+        self.connections.setdefault(module.protocol, set()).add(writer)
+
+    def _untrack(self, module, writer):
+        self.connections.get(module.protocol, set()).discard(writer)
+        writer.close()
+
+    async def _handle_stream(self, module, reader, writer):
+        decoder = StreamDecoder(module.framing)
+        self._track(module, writer)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                decoder.feed(data)
+                for frame in decoder.frames():
+                    await self.deliver(module, frame)
+            tail = decoder.flush()
+            if tail:
+                await self.deliver(module, tail)
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            self._untrack(module, writer)
+
+    async def _read_chunked(self, reader):
+        """Body sent with Transfer-Encoding: chunked (e.g. a streamed NDJSON batch upload)"""
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0].strip(), 16)
+            if not size:
+                break
+            if len(body) + size > MAX_FRAME:
+                raise ValueError(f"Chunked body exceeds {MAX_FRAME} bytes")
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)  # CRLF after every chunk
+        # Trailer headers, if any, end with an empty line
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return bytes(body)
+
+    def _content_length(self, headers):
+        """Body size from Content-Length, capped like every other frame"""
+        length = int(headers.get("content-length", 0))
+        if not 0 <= length <= MAX_FRAME:
+            raise ValueError(f"Content-Length must be between 0 and {MAX_FRAME} bytes")
+        return length
+
+    def _respond(self, writer, status, keep_alive):
+        payload = json.dumps({"status": "success" if status == 200 else "error"}).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+
+    async def _handle_http(self, module, reader, writer):
+        self._track(module, writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                encoding = headers.get("transfer-encoding", "").lower()
+                if encoding and encoding != "chunked":
+                    # Anything else would leave the body to be parsed as the next request
+                    self._respond(writer, 501, False)
+                    await writer.drain()
+                    break
+                try:
+                    if encoding:
+                        body = await self._read_chunked(reader)
+                    else:
+                        body = await reader.readexactly(self._content_length(headers))
+                except ValueError:
+                    # Malformed or oversized: the rest of the stream cannot be framed, so close
+                    self._respond(writer, 400, False)
+                    await writer.drain()
+                    break
+                if path == "/metrics" and method == "GET":
+                    payload = module.core.metrics.render().encode()
+                    writer.write(
+                        f"HTTP/1.1 200 OK\r\n"
+                        f"Content-Type: text/plain; version=0.0.4\r\n"
+                        f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                    await writer.drain()
+                    continue
+                if path == "/health" and method == "GET":
+                    status = 200
+                elif path not in ("/api/data", "/api/data/batch"):
+                    status = 404
+                elif method != "POST":
+                    status = 405
+                else:
+                    try:
+                        delivered = await self.deliver(module, body, batch=path.endswith("/batch"), timeout=5)
+                        status = 200 if delivered else 400
+                    except queue.Full:
+                        status = 503
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._respond(writer, status, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._untrack(module, writer)
+
+
+class AsyncLECCCore(LECCCore):
+    """LECCCore variant whose TCP/UDP/HTTP endpoints all live on one asyncio loop"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.engine = AsyncEngine()
+        self.engine.start()
+
+    def emulate_module(self, module):
+        if module.protocol not in STREAM_PROTOCOLS + DATAGRAM_PROTOCOLS:
+            module.start_emulator()
+            return
+        self.engine.open_endpoint(module)
+        print(f"[✓] {module.protocol} emulated at {module.config['host']}:{module.config['port']}")
+        module.emulated = True
+        module.breaker.reset()
+        module.available = True
+
+    def open_endpoint(self, module):
+        if module.protocol in ["tcp", "udp", "http"] or (
+                module.emulated and module.protocol in STREAM_PROTOCOLS + DATAGRAM_PROTOCOLS):
+            self.engine.open_endpoint(module)
+        else:
+            super().open_endpoint(module)
+
+    def close_endpoint(self, protocol):
+        if protocol in self.engine.servers:
+            self.engine.close_endpoint(self.modules[protocol])
+        else:
+            super().close_endpoint(protocol)
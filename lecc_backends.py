@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+import queue
+import socket
+import threading
+
+from lecc_codec import decode_batch, decode_message
+from lecc_datagram import DatagramSender
+from lecc_framing import DatagramReader, StreamDecoder, encode_frame, unpack_datagram
+
+# Protocol -> backend class. Built-ins register below; third-party backends are
+# looked up in the "lecc.backends" entry point group the first time a protocol is missing.
+BACKENDS = {}
+ENTRY_POINT_GROUP = "lecc.backends"
+_entry_points_loaded = False
+# Returned by send() when a message was only queued: the flusher reports its outcome
+DEFERRED = object()
+
+
+def register_backend(*protocols):
+    """Class decorator registering a transport backend for one or more protocols"""
+    def decorator(cls):
+        for protocol in protocols:
+            BACKENDS[protocol] = cls
+        return cls
+    return decorator
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    _entry_points_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python 3.7: only the importlib_metadata backport has them
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return
+    found = entry_points()
+    # Python 3.10+ (and recent backports) select by group; 3.8/3.9 return a dict of groups
+    found = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, "select") else found.get(ENTRY_POINT_GROUP, [])
+    for entry_point in found:
+        # The entry point itself is stored; its module is only imported by get_backend
+        BACKENDS.setdefault(entry_point.name, entry_point)
+
+
+def get_backend(protocol):
+    backend = BACKENDS.get(protocol)
+    if backend is None and not _entry_points_loaded:
+        _load_entry_points()
+        backend = BACKENDS.get(protocol)
+    if backend is None:
+        raise ValueError(f"No backend registered for protocol: {protocol}")
+    if not isinstance(backend, type):
+        backend = BACKENDS[protocol] = backend.load()
+    return backend
+
+
+class Backend:
+    """Transport behaviour for one module.
+
+    Sockets, clients and servers stay on the module, where the core and the
+    async engine reach them; optional dependencies are imported in the method
+    that first needs them, so unused protocols never load their libraries.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.config = module.config
+
+    def init(self):
+        pass
+
+    def send(self, message, payload, silent=False):
+        """Deliver one encoded message; raises on failure, may return text to print or DEFERRED"""
+        raise NotImplementedError
+
+    def probe(self, timeout):
+        return True
+
+    def start_emulator(self):
+        pass
+
+    def close_endpoint(self):
+        module = self.module
+        for sock in [module.server_socket, module.socket] + list(module.connections):
+            if sock is None:
+                continue
+            try:
+                # shutdown() wakes threads blocked in accept()/recv(), close() alone does not
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+        module.server_socket = None
+        module.socket = None
+
+    def deliver_payload(self, payload):
+        """Decode and deliver one inbound payload; a bad one is logged and skipped, not fatal"""
+        try:
+            message = decode_message(payload)
+        except ValueError as e:
+            print(f"{self.module.protocol}: Dropped undecodable payload - {e}")
+            return
+        self.module.deliver(message)
+
+    def emulated_at(self):
+        print(f"[✓] {self.module.protocol} emulated at {self.config['host']}:{self.config['port']}")
+
+
+@register_backend("websocket", "ftp", "bluetooth", "zigbee")
+class StreamBackend(Backend):
+    """Framed messages over pooled TCP connections; listens only when emulated"""
+
+    def __init__(self, module):
+        super().__init__(module)
+        self.address = (self.config["host"], self.config["port"])
+
+    def send(self, message, payload, silent=False):
+        self.module.core.connection_pool.send(self.address, encode_frame(payload, self.module.framing))
+
+    def probe(self, timeout):
+        with socket.create_connection(self.address, timeout=timeout):
+            return True
+
+    def listen(self):
+        module = self.module
+        module.server_socket = module.bind_socket(socket.SOCK_STREAM)
+        module.server_socket.listen(5)
+        threading.Thread(target=self._accept, args=(module.server_socket,), daemon=True).start()
+
+    def start_emulator(self):
+        self.listen()
+        self.emulated_at()
+
+    def _accept(self, server_socket):
+        while self.module.running:
+            try:
+                conn, addr = server_socket.accept()
+            except OSError:
+                break  # Endpoint closed
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        # Senders keep pooled connections open and stream framed messages over them
+        module = self.module
+        decoder = StreamDecoder(module.framing)
+        module.connections.add(conn)
+        try:
+            with conn:
+                # Stop reading while the inbound queue is full so TCP flow control pushes back
+                while module.running and module.message_queue.wait_writable() and decoder.recv_into(conn):
+                    for frame in decoder.frames():
+                        self.deliver_payload(frame)
+                tail = decoder.flush()
+                if tail:
+                    self.deliver_payload(tail)
+        except (OSError, ValueError):
+            # ValueError here is a framing error (oversized frame): the stream cannot be resynced
+            pass
+        finally:
+            module.connections.discard(conn)
+
+
+@register_backend("tcp")
+class TcpBackend(StreamBackend):
+    def init(self):
+        self.listen()
+
+
+@register_backend("ethernet")
+class DatagramBackend(Backend):
+    """One message (or one packed batch) per datagram; listens only when emulated"""
+
+    def __init__(self, module):
+        super().__init__(module)
+        self.address = (self.config["host"], self.config["port"])
+        if self.config.get("batch_window"):
+            self.send = self.send_batched
+
+    def send(self, message, payload, silent=False):
+        if not self.module.socket:
+            raise Exception(f"{self.module.protocol} not initialized")
+        self.module.socket.sendto(payload, self.address)
+
+    def send_batched(self, message, payload, silent=False):
+        module = self.module
+        if not module.socket:
+            raise Exception(f"{module.protocol} not initialized")
+        if module.datagram_sender is None:
+            module.datagram_sender = DatagramSender(module)
+        # Packed with other messages sent within the window; the flusher records success or failure
+        module.datagram_sender.submit(message, payload)
+        return DEFERRED
+
+    def probe(self, timeout):
+        # Connectionless: healthy while the bound socket is open
+        sock = self.module.socket
+        return sock is not None and sock.fileno() != -1
+
+    def listen(self):
+        self.module.socket = self.module.bind_socket(socket.SOCK_DGRAM)
+        threading.Thread(target=self._receive, args=(self.module.socket,), daemon=True).start()
+
+    def start_emulator(self):
+        self.listen()
+        self.emulated_at()
+
+    def _receive(self, sock):
+        module = self.module
+        reader = DatagramReader()
+        while module.running and module.message_queue.wait_writable():
+            try:
+                datagrams = reader.recv_batch(sock)
+            except OSError:
+                break  # Endpoint closed
+            for data in datagrams:
+                try:
+                    payloads = unpack_datagram(data)
+                except ValueError as e:
+                    print(f"{module.protocol}: Dropped malformed datagram - {e}")
+                    continue
+                for payload in payloads:
+                    if payload:
+                        self.deliver_payload(payload)
+
+
+@register_backend("udp")
+class UdpBackend(DatagramBackend):
+    def init(self):
+        self.listen()
+
+
+@register_backend("http")
+class HttpBackend(Backend):
+    """Flask/werkzeug endpoint and a keep-alive requests session, both imported on first use"""
+
+    def sender(self):
+        module = self.module
+        if module.http_sender is None:
+            from lecc_http import HttpSender
+            module.http_sender = HttpSender(module)
+        return module.http_sender
+
+    def init(self):
+        from flask import Flask
+        module = self.module
+        module.app = Flask(__name__)
+        # Bound before init returns, so no grace period is needed before the first send
+        self._create_server()
+        threading.Thread(target=module.http_server.serve_forever, daemon=True).start()
+
+    def send(self, message, payload, silent=False):
+        sender = self.sender()
+        if sender.batch_url:
+            # Coalesced into the next batched POST; the flusher records success or failure
+            sender.submit(message, payload)
+            return DEFERRED
+        sender.post(payload)
+        core = self.module.core
+        if not core.http_printed:
+            core.http_printed = True
+            return " 200 OK"
+        return None
+
+    def probe(self, timeout):
+        return self.sender().probe(timeout)
+
+    def close_endpoint(self):
+        module = self.module
+        if module.http_server is not None:
+            module.http_server.shutdown()
+            module.http_server.server_close()
+            module.http_server = None
+        if module.http_sender is not None:
+            # Pooled keep-alive connections would otherwise outlive the server
+            module.http_sender.close()
+        super().close_endpoint()
+
+    def _create_server(self):
+        from flask import request
+        from werkzeug.serving import make_server
+        module = self.module
+
+        @module.app.route("/api/data", methods=["POST"])
+        def receive_data():
+            try:
+                data = decode_message(request.get_data())
+            except ValueError as e:
+                return {"status": "error", "error": str(e)}, 400
+            try:
+                module.deliver(data, timeout=5)
+            except queue.Full:
+                return {"status": "error", "error": "queue full"}, 503
+            return {"status": "success"}
+
+        @module.app.route("/health", methods=["GET"])
+        def health():
+            return {"status": "ok"}
+
+        @module.app.route("/metrics", methods=["GET"])
+        def metrics():
+            return module.core.metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+        @module.app.route("/api/data/batch", methods=["POST"])
+        def receive_batch():
+            try:
+                messages = decode_batch(request.get_data())
+            except ValueError as e:
+                return {"status": "error", "error": str(e)}, 400
+            try:
+                for message in messages:
+                    module.deliver(message, timeout=5)
+            except queue.Full:
+                return {"status": "error", "error": "queue full"}, 503
+            return {"status": "success", "received": len(messages)}
+        port = self.config["port"]
+        print(f"Starting HTTP server: Running on all addresses (0.0.0.0) ||| http://127.0.0.1:{port} ||| http://192.168.1.14:{port}")
+        if self.config.get("reuse_port"):
+            sock = module.bind_socket(socket.SOCK_STREAM, "0.0.0.0")
+            sock.listen(128)
+            # werkzeug duplicates the descriptor, so the pre-bound socket can be closed
+            module.http_server = make_server("0.0.0.0", port, module.app, threaded=True, fd=sock.fileno())
+            sock.close()
+        else:
+            module.http_server = make_server("0.0.0.0", port, module.app, threaded=True)
+
+
+@register_backend("mqtt")
+class MqttBackend(Backend):
+    """paho client, imported on first use; emulated by an in-process broker (see lecc_mqtt)"""
+
+    def start_broker(self):
+        """Run the local broker on the configured address, or in-process only if the port is taken"""
+        from lecc_mqtt import MqttBroker
+        module = self.module
+        if module.broker is not None:
+            module.broker.close()
+        module.broker = MqttBroker(module.message_queue.capacity)
+        try:
+            module.broker.listen(self.config["host"], self.config["port"])
+        except OSError as e:
+            print(f"MQTT broker not listening on {self.config['host']}:{self.config['port']} ({e}), in-process only")
+        return module.broker
+
+    def init(self):
+        module = self.module
+        if module.emulated:
+            return
+        if self.config.get("embedded_broker"):
+            # Offline deployments and benchmarks: a real paho client against the local broker
+            self.start_broker()
+        import paho.mqtt.client as mqtt
+        connected = threading.Event()
+
+        def on_connect(client, userdata, flags, reason_code, properties):
+            # (Re)subscribe on every connect so a reconnect restores the subscription
+            client.subscribe(self.config["topic"], self.config.get("qos", 0))
+            connected.set()
+        module.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        module.client.on_connect = on_connect
+        module.client.on_message = self.on_message
+        try:
+            module.client.connect(self.config["host"], self.config["port"])
+            module.client.loop_start()
+            module.connected = True
+            # The availability probe right after init should see the CONNACK
+            connected.wait(self.config.get("probe_timeout", 1.0))
+        except Exception as e:
+            print(f"MQTT initialization error: {e}")
+
+    def on_message(self, client, userdata, msg):
+        self.deliver_payload(msg.payload)
+
+    def on_publish(self, topic, payload, qos, retain):
+        # Called by the in-process broker with the publisher's own payload object
+        self.deliver_payload(payload)
+
+    def send(self, message, payload, silent=False):
+        module = self.module
+        if not module.connected:
+            raise Exception("MQTT not connected")
+        if module.emulated:
+            module.broker.publish(self.config["topic"], payload, self.config.get("qos", 0))
+            return f"MQTT simulated: {message['data']}"
+        module.client.publish(self.config["topic"], payload, self.config.get("qos", 0))
+        return None
+
+    def probe(self, timeout):
+        module = self.module
+        if module.emulated:
+            return module.connected and module.broker is not None and module.broker.running
+        return module.client is not None and module.client.is_connected()
+
+    def start_emulator(self):
+        module = self.module
+        broker = self.start_broker()
+        # Delivered synchronously in the publishing thread: no polling and no extra queue
+        broker.subscribe(self.config["topic"], self.on_publish, self.config.get("qos", 0))
+        module.connected = True
+        self.emulated_at()
+
+    def close_endpoint(self):
+        module = self.module
+        if module.client is not None:
+            module.client.loop_stop()
+            module.client.disconnect()
+        if module.broker is not None:
+            module.broker.close()
+            module.broker = None
+        module.connected = False
+        super().close_endpoint()
+
+
+@register_backend("uart")
+class UartBackend(Backend):
+    """pyserial on /dev/ttyUSB0, simulated when the port or the library is missing"""
+
+    def init(self):
+        try:
+            import serial
+            self.module.serial = serial.Serial("/dev/ttyUSB0", 9600, timeout=1)
+            print("UART initialized on /dev/ttyUSB0")
+        except Exception:
+            print("UART simulated (no hardware)")
+            self.module.serial = None
+
+    def send(self, message, payload, silent=False):
+        if self.module.serial:
+            self.module.serial.write(payload)
+            return None
+        return f"UART/I2C simulated: {message['data']}"
+
+
+@register_backend("i2c")
+class I2cBackend(Backend):
+    """smbus2 on bus 1, simulated when the bus or the library is missing"""
+
+    def init(self):
+        try:
+            import smbus2 as smbus
+            self.module.bus = smbus.SMBus(1)
+            print("I2C initialized on bus 1")
+        except Exception:
+            print("I2C simulated (no hardware)")
+            self.module.bus = None
+
+    def send(self, message, payload, silent=False):
+        if self.module.bus:
+            self.module.bus.write_i2c_block_data(self.config["address"], 0, list(payload))
+            return None
+        return f"UART/I2C simulated: {message['data']}"
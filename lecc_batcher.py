@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    """Coalesces messages submitted within batch_window of each other.
+
+    A flusher thread, started on the first submit, hands up to batch_size
+    (message, payload) pairs at a time to flush(batch), which subclasses
+    implement and which records success or failure for the whole batch.
+    """
+
+    def __init__(self, module, batch_size, batch_window):
+        self.module = module
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        # Bounded: when flushes fall behind, send() fails and the message goes to the failed queue
+        self.pending = queue.Queue(module.config.get("send_queue_capacity", 10000))
+        self.flusher = None
+        self.lock = threading.Lock()
+
+    def submit(self, message, payload):
+        """Queue an encoded message for the next flush"""
+        try:
+            self.pending.put_nowait((message, payload))
+        except queue.Full:
+            raise Exception(f"{self.module.protocol} send queue full")
+        if self.flusher is None:
+            with self.lock:
+                if self.flusher is None:
+                    self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                    self.flusher.start()
+
+    def _flush_loop(self):
+        while self.module.running:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            self.flush(batch)
+
+    def flush(self, batch):
+        raise NotImplementedError
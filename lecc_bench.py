@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""Loopback benchmark: drive the LECC core at a fixed rate, kill and restore endpoints, report JSON.
+
+    python lecc_bench.py --rate 2000 --size 256 --duration 30 --kill tcp@10 --restore tcp@20 --output run.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from lecc import LECCCore, GenericModule, protocol_configs
+from lecc_metrics import Histogram
+
+DEFAULT_PROTOCOLS = ["tcp", "udp", "http", "mqtt"]
+
+
+def parse_event(text):
+    """'tcp@10' -> ('tcp', 10.0)"""
+    protocol, _, at = text.partition("@")
+    if not protocol or not at:
+        raise argparse.ArgumentTypeError(f"Expected PROTOCOL@SECONDS, got {text!r}")
+    return protocol, float(at)
+
+
+def build_core(firewall=False, use_async=False):
+    if firewall:
+        from leccfirewall import AsyncLeccFirewall, LeccFirewall
+        return AsyncLeccFirewall() if use_async else LeccFirewall()
+    if use_async:
+        from lecc_async import AsyncLECCCore
+        return AsyncLECCCore()
+    return LECCCore()
+
+
+class Benchmark:
+    """Open-loop load generator with scheduled endpoint kills and restores"""
+
+    def __init__(self, core, protocols, rate=1000.0, size=128, duration=10.0, kills=(), restores=(),
+                 drain_timeout=30.0, configs=None):
+        self.core = core
+        self.protocols = protocols
+        self.configs = configs or protocol_configs
+        self.rate = rate
+        self.size = size
+        self.duration = duration
+        self.kills = list(kills)
+        self.restores = list(restores)
+        self.drain_timeout = drain_timeout
+        self.transitions = []
+        self.failovers = []
+        self.recoveries = []
+        self.lock = threading.Lock()
+        # Set once the run has drained; kill/restore watchers stop and report what they saw
+        self.finished = threading.Event()
+
+    def setup(self):
+        for protocol in self.protocols:
+            self.core.register_module(protocol, GenericModule(protocol, self.configs[protocol]))
+        self.core.wait_ready()
+        module = self.core.modules.get("mqtt")
+        # No broker on loopback: measure against the in-process emulator (--mqtt-broker runs a real one)
+        if module is not None and not module.emulated and not module.connected:
+            self.core.emulate_module(module)
+        if hasattr(self.core, "assign_roles"):
+            self.core.assign_roles()
+        self.core.availability_listeners.append(self._on_availability_change)
+
+    def _on_availability_change(self, module, available):
+        with self.lock:
+            self.transitions.append((time.monotonic(), module.protocol, available))
+
+    def _first_transition(self, protocol, available, after):
+        with self.lock:
+            for at, p, value in self.transitions:
+                if p == protocol and value == available and at >= after:
+                    return at
+        return None
+
+    def _received(self):
+        return {p: m.received_total.get() for p, m in self.core.modules.items()}
+
+    def _backlog(self):
+        return sum(m.failed_message_queue.qsize() for m in self.core.modules.values())
+
+    def _idle(self):
+        modules = self.core.modules.values()
+        return (not self._backlog() and not self.core.scheduler.qsize()
+                and not any(m.message_queue.qsize() for m in modules))
+
+    def _kill(self, protocol):
+        killed_at = time.monotonic()
+        self.core.close_endpoint(protocol)
+        # Detection needs traffic or a probe; an undetected kill is reported as None
+        detected_at = None
+        while self.core.running:
+            detected_at = self._first_transition(protocol, False, killed_at)
+            if detected_at is not None or self.finished.wait(0.001):
+                break
+        with self.lock:
+            self.failovers.append({
+                "protocol": protocol, "killed_at": killed_at - self.started,
+                "detection_seconds": None if detected_at is None else detected_at - killed_at})
+
+    def _restore(self, protocol):
+        module = self.core.modules[protocol]
+        restored_at = time.monotonic()
+        backlog = module.failed_message_queue.qsize()
+        self.core.reopen_endpoint(protocol)
+        available_at = self._first_transition(protocol, True, restored_at)
+        if available_at is None and module.available:
+            available_at = time.monotonic()
+        while module.failed_message_queue.qsize() and not self.finished.wait(0.005):
+            pass
+        drained_at = time.monotonic()
+        with self.lock:
+            self.recoveries.append({
+                "protocol": protocol, "restored_at": restored_at - self.started, "backlog": backlog,
+                "recovery_seconds": None if available_at is None else available_at - restored_at,
+                "drain_seconds": None if module.failed_message_queue.qsize() else drained_at - restored_at})
+
+    def _schedule(self):
+        events = [(at, self._kill, p) for p, at in self.kills] + [(at, self._restore, p) for p, at in self.restores]
+        threads = []
+        for at, action, protocol in sorted(events, key=lambda event: event[0]):
+            # Events due after the run has finished are skipped
+            if self.finished.wait(max(0.0, self.started + at - time.monotonic())):
+                break
+            thread = threading.Thread(target=action, args=(protocol,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def generate(self):
+        """Route messages at the target rate; lateness is made up rather than skipped"""
+        padding = "x" * max(0, self.size - 10)
+        sent = 0
+        while True:
+            now = time.monotonic()
+            elapsed = now - self.started
+            if elapsed >= self.duration:
+                return sent
+            due = int(elapsed * self.rate) + 1
+            while sent < due:
+                self.core.route_message({"data": f"{sent:010d}{padding}"}, "bench")
+                sent += 1
+            time.sleep(min(1.0 / self.rate, 0.01))
+
+    def run(self):
+        before = self._received()
+        self.started = time.monotonic()
+        scheduler = threading.Thread(target=self._schedule, daemon=True)
+        scheduler.start()
+        generated = self.generate()
+        generated_for = time.monotonic() - self.started
+        drain_started = time.monotonic()
+        while not self._idle() and time.monotonic() - drain_started < self.drain_timeout:
+            time.sleep(0.01)
+        drain_seconds = time.monotonic() - drain_started if self._idle() else None
+        # Batching senders may still hold the last messages; wait until deliveries stop changing
+        received = None
+        while received != self._received():
+            received = self._received()
+            time.sleep(0.05)
+        self.finished.set()
+        scheduler.join()
+        elapsed = time.monotonic() - self.started
+        after = self._received()
+        return self.report(generated, generated_for, elapsed, drain_seconds,
+                           {p: after[p] - before.get(p, 0) for p in after})
+
+    def report(self, generated, generated_for, elapsed, drain_seconds, delivered):
+        overall = Histogram()
+        latency = {}
+        for protocol, module in self.core.modules.items():
+            overall.merge(module.receive_latency)
+            latency[protocol] = module.receive_latency.snapshot()
+        latency["all"] = overall.snapshot()
+        return {
+            "config": {"protocols": self.protocols, "rate": self.rate, "size": self.size,
+                       "duration": self.duration, "core": type(self.core).__name__,
+                       "kills": self.kills, "restores": self.restores},
+            "generated": generated,
+            "generated_per_second": generated / generated_for,
+            "delivered": delivered,
+            "delivered_total": sum(delivered.values()),
+            "delivered_per_second": sum(delivered.values()) / elapsed,
+            "elapsed_seconds": elapsed,
+            "final_drain_seconds": drain_seconds,
+            "backlog_remaining": self._backlog(),
+            "latency_seconds": latency,
+            "failovers": sorted(self.failovers, key=lambda event: event["killed_at"]),
+            "recoveries": sorted(self.recoveries, key=lambda event: event["restored_at"]),
+            "metrics": self.core.metrics.snapshot(),
+        }
+
+
+def summary(result):
+    lines = [f"Generated {result['generated']} messages at {result['generated_per_second']:.0f} msg/s, "
+             f"delivered {result['delivered_total']} at {result['delivered_per_second']:.0f} msg/s"]
+    for protocol, stats in sorted(result["latency_seconds"].items()):
+        if stats["count"]:
+            lines.append(f"  {protocol}: p50 {stats['p50'] * 1000:.2f} ms, p99 {stats['p99'] * 1000:.2f} ms "
+                         f"({stats['count']} samples)")
+    for event in result["failovers"]:
+        detected = event["detection_seconds"]
+        lines.append(f"  kill {event['protocol']} @ {event['killed_at']:.1f}s: detected in "
+                     + (f"{detected * 1000:.1f} ms" if detected is not None else "never"))
+    for event in result["recoveries"]:
+        recovered, drained = event["recovery_seconds"], event["drain_seconds"]
+        lines.append(f"  restore {event['protocol']} @ {event['restored_at']:.1f}s: available in "
+                     + (f"{recovered:.2f}s" if recovered is not None else "never")
+                     + f", backlog of {event['backlog']} drained in "
+                     + (f"{drained:.2f}s" if drained is not None else "timeout"))
+    if result["final_drain_seconds"] is None:
+        lines.append(f"  {result['backlog_remaining']} messages still backlogged at the end")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Loopback load generator and failover benchmark for LECC")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Messages per second (default 1000)")
+    parser.add_argument("--size", type=int, default=128, help="Payload size in bytes (default 128)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load (default 10)")
+    parser.add_argument("--protocols", default=",".join(DEFAULT_PROTOCOLS),
+                        help="Comma-separated loopback protocols (default tcp,udp,http,mqtt)")
+    parser.add_argument("--kill", type=parse_event, action="append", default=[], metavar="PROTOCOL@SECONDS",
+                        help="Close an endpoint partway through the run; repeatable")
+    parser.add_argument("--restore", type=parse_event, action="append", default=[], metavar="PROTOCOL@SECONDS",
+                        help="Reopen a killed endpoint; repeatable")
+    parser.add_argument("--batch-window", type=float, default=None, metavar="SECONDS",
+                        help="Micro-batch UDP/Ethernet sends within this window")
+    parser.add_argument("--mqtt-broker", action="store_true",
+                        help="Connect a paho client to the embedded MQTT broker instead of using the in-process emulator")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="Seconds to wait for backlogs to drain")
+    parser.add_argument("--firewall", action="store_true", help="Benchmark LeccFirewall instead of the plain core")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use the asyncio endpoint engine")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-message core logs")
+    args = parser.parse_args(argv)
+    protocols = [p.strip() for p in args.protocols.split(",") if p.strip()]
+    for protocol, _ in args.kill + args.restore:
+        if protocol not in protocols:
+            parser.error(f"{protocol} is not one of the benchmarked protocols")
+
+    configs = {p: dict(config) for p, config in protocol_configs.items()}
+    if args.batch_window:
+        for protocol in ("udp", "ethernet"):
+            configs[protocol]["batch_window"] = args.batch_window
+    if args.mqtt_broker:
+        configs["mqtt"]["embedded_broker"] = True
+    if not args.verbose:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        core = build_core(args.firewall, args.use_async)
+        bench = Benchmark(core, protocols, args.rate, args.size, args.duration, args.kill, args.restore,
+                          args.drain_timeout, configs)
+        bench.setup()
+        result = bench.run()
+        core.running = False
+        for module in core.modules.values():
+            module.running = False
+        # Consumers poll with a 0.5 s timeout; let them see the flag before stdout is restored
+        time.sleep(0.6)
+    print(summary(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Per-module circuit breaker.
+
+    closed: traffic flows; failure_threshold consecutive failures open it
+    open: sends are skipped without touching the link until retry_at
+    half_open: one probe is in flight; success closes, failure re-opens with a longer backoff
+    Backoff doubles per consecutive open up to max_delay, with jitter so many
+    modules that failed together do not all retry in the same instant.
+    """
+
+    def __init__(self, failure_threshold=3, base_delay=0.5, max_delay=30.0, jitter=0.5):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.state = CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self.state == CLOSED
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def try_half_open(self):
+        """Claim the single trial of an open breaker whose backoff has elapsed"""
+        with self.lock:
+            if self.state != OPEN or time.monotonic() < self.retry_at:
+                return False
+            self.state = HALF_OPEN
+            return True
+
+    def _open(self):
+        self.opens += 1
+        self.state = OPEN
+        self.retry_at = time.monotonic() + self.backoff(self.opens)
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opens = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._open()
+
+    def trip(self):
+        """Open now, e.g. because another worker saw the link fail"""
+        with self.lock:
+            if self.state == CLOSED:
+                self._open()
+
+    def reset(self):
+        self.record_success()
+
+
+class HealthProber:
+    """Background out-of-band probes that drive every module's breaker.
+
+    Closed modules are probed every probe_interval so idle links that die are
+    still noticed; open modules are probed once their backoff elapses, so links
+    that come back are restored without any traffic being risked on them.
+    """
+
+    def __init__(self, core, interval=5.0):
+        self.core = core
+        self.interval = interval
+        self.last_probe = {}
+        self.wakeup = threading.Event()
+        core.availability_listeners.append(self._on_availability_change)
+
+    def _on_availability_change(self, module, available):
+        if not available:
+            # Re-plan so the first half-open probe is not delayed by a full interval
+            self.wakeup.set()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def check(self, module):
+        """Probe one module now and feed the result to its breaker"""
+        self.last_probe[module.protocol] = time.monotonic()
+        try:
+            healthy = module.probe()
+            error = "probe failed"
+        except Exception as e:
+            healthy = False
+            error = e
+        if healthy:
+            module.record_success()
+        else:
+            module.record_failure(error, [], silent=True)
+        return healthy
+
+    def _next_due(self, module):
+        breaker = module.breaker
+        if breaker.state == OPEN:
+            return breaker.retry_at
+        interval = module.config.get("probe_interval", self.interval)
+        return self.last_probe.get(module.protocol, 0.0) + interval
+
+    def run(self):
+        while self.core.running:
+            now = time.monotonic()
+            wake_at = now + self.interval
+            for protocol, module in list(self.core.modules.items()):
+                startup = self.core.startup.get(protocol)
+                if startup is None or not startup.done():
+                    continue  # test_availability owns the module until it has started
+                due = self._next_due(module)
+                if due <= now and (module.breaker.closed or module.breaker.try_half_open()):
+                    self.check(module)
+                    due = self._next_due(module)
+                wake_at = min(wake_at, due)
+            self.wakeup.wait(max(0.0, wake_at - time.monotonic()))
+            self.wakeup.clear()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+
+HISTORY_KEY = "masked_history"
+
+# Binary payloads start with a byte that can never open a JSON document
+BINARY_MAGIC = 0xC1
+TAG_NONE, TAG_FALSE, TAG_TRUE, TAG_INT, TAG_FLOAT, TAG_STR, TAG_LIST, TAG_DICT, TAG_BYTES = range(9)
+FLOAT = struct.Struct("!d")
+
+
+class JsonCodec:
+    """Plain UTF-8 JSON, the wire format every LECC endpoint understands"""
+    name = "json"
+    binary = False
+
+    def encode(self, message):
+        return json.dumps(message).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+    def encode_prefix(self, body):
+        # Everything but the closing brace, so a history field can be spliced in
+        head = json.dumps(body)[:-1]
+        return (head + ", " if body else head).encode()
+
+    def encode_history(self, history):
+        return f'"{HISTORY_KEY}": {json.dumps(history)}}}'.encode()
+
+
+def _write_varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _need(data, pos, size):
+    if pos + size > len(data):
+        raise ValueError("Truncated binary codec payload")
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        _need(data, pos, 1)
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_str(value, out):
+    raw = value.encode()
+    _write_varint(len(raw), out)
+    out += raw
+
+
+def _write_value(value, out):
+    if value is None:
+        out.append(TAG_NONE)
+    elif value is True:
+        out.append(TAG_TRUE)
+    elif value is False:
+        out.append(TAG_FALSE)
+    elif isinstance(value, int):
+        out.append(TAG_INT)
+        _write_varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+    elif isinstance(value, float):
+        out.append(TAG_FLOAT)
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        out.append(TAG_STR)
+        _write_str(value, out)
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(TAG_BYTES)
+        _write_varint(len(value), out)
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(TAG_LIST)
+        _write_varint(len(value), out)
+        for item in value:
+            _write_value(item, out)
+    elif isinstance(value, dict):
+        out.append(TAG_DICT)
+        _write_varint(len(value), out)
+        for key, item in value.items():
+            _write_str(str(key), out)
+            _write_value(item, out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} with the binary codec")
+
+
+def _read_value(data, pos):
+    _need(data, pos, 1)
+    tag = data[pos]
+    pos += 1
+    if tag == TAG_NONE:
+        return None, pos
+    if tag == TAG_TRUE:
+        return True, pos
+    if tag == TAG_FALSE:
+        return False, pos
+    if tag == TAG_INT:
+        value, pos = _read_varint(data, pos)
+        return (value >> 1) ^ -(value & 1), pos
+    if tag == TAG_FLOAT:
+        _need(data, pos, FLOAT.size)
+        return FLOAT.unpack_from(data, pos)[0], pos + FLOAT.size
+    if tag in (TAG_STR, TAG_BYTES):
+        size, pos = _read_varint(data, pos)
+        _need(data, pos, size)
+        raw = bytes(data[pos:pos + size])
+        return (raw.decode() if tag == TAG_STR else raw), pos + size
+    if tag == TAG_LIST:
+        size, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(size):
+            item, pos = _read_value(data, pos)
+            items.append(item)
+        return items, pos
+    if tag == TAG_DICT:
+        size, pos = _read_varint(data, pos)
+        items = {}
+        for _ in range(size):
+            key_size, pos = _read_varint(data, pos)
+            _need(data, pos, key_size)
+            key = bytes(data[pos:pos + key_size]).decode()
+            items[key], pos = _read_value(data, pos + key_size)
+        return items, pos
+    raise ValueError(f"Unknown binary codec tag: {tag}")
+
+
+class BinaryCodec:
+    """Compact tagged binary encoding for constrained links (UART, I2C, UDP)"""
+    name = "binary"
+    binary = True
+
+    def encode(self, message):
+        out = bytearray([BINARY_MAGIC])
+        _write_value(message, out)
+        return bytes(out)
+
+    def decode(self, data):
+        if not data or data[0] != BINARY_MAGIC:
+            raise ValueError("Not a binary codec payload")
+        value, pos = _read_value(data, 1)
+        if pos != len(data):
+            raise ValueError("Trailing bytes after binary codec payload")
+        return value
+
+    def encode_prefix(self, body):
+        # Dict header already counts the history field appended by encode_history
+        out = bytearray([BINARY_MAGIC, TAG_DICT])
+        _write_varint(len(body) + 1, out)
+        for key, item in body.items():
+            _write_str(str(key), out)
+            _write_value(item, out)
+        return bytes(out)
+
+    def encode_history(self, history):
+        out = bytearray()
+        _write_str(HISTORY_KEY, out)
+        _write_value(history, out)
+        return bytes(out)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), BinaryCodec())}
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown codec: {name}")
+
+
+def detect_codec(data):
+    """Pick the codec from the first payload byte"""
+    return CODECS["binary"] if data and data[0] == BINARY_MAGIC else CODECS["json"]
+
+
+def check_message(message):
+    """Inbound messages must be objects with a data field; anything else would break the consumer"""
+    if not isinstance(message, dict):
+        raise ValueError(f"Message must be an object, got {type(message).__name__}")
+    if "data" not in message:
+        raise ValueError("Message has no data field")
+    return message
+
+
+def decode_message(data):
+    """Decode a payload in any registered codec and stamp the codec in the envelope"""
+    codec = detect_codec(data)
+    message = check_message(codec.decode(data))
+    message["codec"] = codec.name
+    return message
+
+
+def decode_batch(body):
+    """Parse a batch body sent as a JSON array or as NDJSON (one object per line)"""
+    text = body.decode() if isinstance(body, (bytes, bytearray)) else body
+    if text.lstrip().startswith("["):
+        messages = json.loads(text)
+        if not isinstance(messages, list):
+            raise ValueError("Batch body must be a JSON array")
+    else:
+        messages = [json.loads(line) for line in text.splitlines() if line.strip()]
+    # All or nothing: one malformed element rejects the whole batch
+    for message in messages:
+        check_message(message)["codec"] = "json"
+    return messages
+
+
+class EncodedMessage:
+    """Serialize-once cache for a fanned-out message.
+
+    The body (everything but masked_history) is encoded at most once per codec;
+    each target only pays for splicing its own history onto the cached prefix.
+    """
+
+    def __init__(self, message):
+        self.body = {k: v for k, v in message.items() if k != HISTORY_KEY}
+        self.prefixes = {}
+
+    def render(self, codec, history):
+        prefix = self.prefixes.get(codec.name)
+        if prefix is None:
+            prefix = self.prefixes[codec.name] = codec.encode_prefix(self.body)
+        return prefix + codec.encode_history(history)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from lecc_batcher import MicroBatcher
+from lecc_framing import DEFAULT_MTU, MAX_DATAGRAM, pack_datagrams
+
+
+class DatagramSender(MicroBatcher):
+    """Micro-batching for UDP/Ethernet modules.
+
+    Messages sent within batch_window of each other are packed into as few
+    MTU-sized datagrams as possible, so a burst costs one sendto per datagram
+    instead of one per message. Enabled by a batch_window in the module config.
+    """
+
+    def __init__(self, module):
+        super().__init__(module, module.config.get("batch_size", 256), module.config.get("batch_window", 0.002))
+        self.address = (module.config["host"], module.config["port"])
+        self.mtu = min(module.config.get("mtu", DEFAULT_MTU), MAX_DATAGRAM)
+        self.datagrams_total = module.core.metrics.counter(
+            "lecc_packed_datagrams_total", "Datagrams sent by the micro-batcher", protocol=module.protocol)
+
+    def flush(self, batch):
+        sent = 0
+        try:
+            sock = self.module.socket
+            if sock is None:
+                raise Exception(f"{self.module.protocol} socket closed")
+            for datagram, count in pack_datagrams([payload for _, payload in batch], self.mtu):
+                sock.sendto(datagram, self.address)
+                self.datagrams_total.inc()
+                sent += count
+        except Exception as e:
+            self.module.sent_total.inc(sent)
+            self.module.record_failure(e, [message for message, _ in batch[sent:]], silent=True)
+            return
+        self.module.record_success()
+        self.module.sent_total.inc(sent)
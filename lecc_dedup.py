@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+
+
+class DedupCache:
+    """Recently seen message IDs, bounded by count (LRU) and by age (TTL).
+
+    Entries are kept in expiry order: a repeat sighting refreshes the TTL and
+    moves the ID to the end, so expired and least recently seen IDs are always
+    at the front and are evicted first.
+    """
+
+    def __init__(self, capacity=100000, ttl=60.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.evicted = 0
+
+    def seen(self, key):
+        """Record key and return True if it was already seen within the TTL"""
+        now = time.monotonic()
+        with self.lock:
+            while self.entries:
+                oldest, expires = next(iter(self.entries.items()))
+                if expires > now:
+                    break
+                del self.entries[oldest]
+            duplicate = key in self.entries
+            if duplicate:
+                self.duplicates += 1
+                self.entries.move_to_end(key)
+            self.entries[key] = now + self.ttl
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evicted += 1
+            return duplicate
+
+    def __len__(self):
+        return len(self.entries)
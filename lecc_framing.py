@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import socket
+import struct
+
+# "newline": one message per line (JSON never contains a raw newline)
+# "length": 4-byte big-endian length prefix, safe for any binary payload
+FRAMING_MODES = ("newline", "length")
+LENGTH_HEADER = struct.Struct("!I")
+MAX_FRAME = 16 * 1024 * 1024
+MAX_DATAGRAM = 65535
+# Packed datagrams: BATCH_MAGIC, then (2-byte length, payload) records. The magic byte
+# opens neither JSON nor a binary codec payload, so single messages are sent unpacked.
+BATCH_MAGIC = 0xC2
+RECORD_LENGTH = struct.Struct("!H")
+DEFAULT_MTU = 1472  # 1500-byte Ethernet MTU minus IPv4 and UDP headers
+
+
+def encode_frame(payload, mode="newline"):
+    """Wrap an encoded message so a stream receiver can find its boundaries"""
+    if mode == "length":
+        return LENGTH_HEADER.pack(len(payload)) + payload
+    if mode == "newline":
+        return payload + b"\n"
+    raise ValueError(f"Unknown framing mode: {mode}")
+
+
+def _datagram(group):
+    if len(group) == 1:
+        return group[0]
+    out = bytearray([BATCH_MAGIC])
+    for payload in group:
+        out += RECORD_LENGTH.pack(len(payload))
+        out += payload
+    return bytes(out)
+
+
+def pack_datagrams(payloads, mtu=DEFAULT_MTU):
+    """Pack encoded messages into as few datagrams as fit the MTU; yields (datagram, message count)"""
+    group = []
+    size = 1
+    for payload in payloads:
+        record = RECORD_LENGTH.size + len(payload)
+        if group and size + record > mtu:
+            yield _datagram(group), len(group)
+            group = []
+            size = 1
+        group.append(payload)
+        size += record
+    if group:
+        yield _datagram(group), len(group)
+
+
+def unpack_datagram(data):
+    """Split a packed datagram back into its payloads; any other datagram is a single payload"""
+    if not data or data[0] != BATCH_MAGIC:
+        return [data]
+    view = memoryview(data)
+    payloads = []
+    pos = 1
+    while pos < len(data):
+        if pos + RECORD_LENGTH.size > len(data):
+            raise ValueError("Truncated packed datagram")
+        size, = RECORD_LENGTH.unpack_from(data, pos)
+        pos += RECORD_LENGTH.size
+        if pos + size > len(data):
+            raise ValueError("Truncated packed datagram")
+        payloads.append(bytes(view[pos:pos + size]))
+        pos += size
+    return payloads
+
+
+class StreamDecoder:
+    """Incremental frame decoder over a single reusable receive buffer"""
+
+    def __init__(self, mode="newline", buffer_size=65536, max_frame=MAX_FRAME):
+        if mode not in FRAMING_MODES:
+            raise ValueError(f"Unknown framing mode: {mode}")
+        self.mode = mode
+        self.max_frame = max_frame
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.scan = 0
+
+    def _reserve(self, size):
+        """Make room for at least size more bytes after the buffered data"""
+        if len(self.buffer) - self.end >= size:
+            return
+        pending = self.end - self.start
+        if self.start and len(self.buffer) - pending >= size:
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            if pending + size > self.max_frame + LENGTH_HEADER.size:
+                raise ValueError(f"Frame exceeds {self.max_frame} bytes")
+            capacity = len(self.buffer)
+            while capacity - pending < size:
+                capacity *= 2
+            buffer = bytearray(capacity)
+            buffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(buffer)
+        self.scan -= self.start
+        self.start = 0
+        self.end = pending
+
+    def recv_into(self, sock):
+        """Read from sock straight into the buffer; returns 0 on EOF"""
+        self._reserve(4096)
+        received = sock.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def feed(self, data):
+        """Append bytes that were read elsewhere (e.g. by an asyncio transport)"""
+        self._reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self):
+        """Yield every complete frame currently buffered"""
+        while True:
+            if self.mode == "newline":
+                newline = self.buffer.find(b"\n", max(self.scan, self.start), self.end)
+                if newline < 0:
+                    self.scan = self.end
+                    return
+                frame = bytes(self.view[self.start:newline])
+                self.start = self.scan = newline + 1
+                if frame.strip():
+                    yield frame
+            else:
+                if self.end - self.start < LENGTH_HEADER.size:
+                    return
+                size, = LENGTH_HEADER.unpack_from(self.buffer, self.start)
+                if size > self.max_frame:
+                    raise ValueError(f"Frame exceeds {self.max_frame} bytes")
+                begin = self.start + LENGTH_HEADER.size
+                if self.end - begin < size:
+                    self._reserve(size - (self.end - begin))
+                    return
+                self.start = begin + size
+                yield bytes(self.view[begin:self.start])
+
+    def flush(self):
+        """Return an unterminated trailing message at EOF (newline mode only)"""
+        if self.mode != "newline" or self.start == self.end:
+            return None
+        frame = bytes(self.view[self.start:self.end])
+        self.start = self.end = self.scan = 0
+        return frame if frame.strip() else None
+
+
+class DatagramReader:
+    """Reusable receive buffer sized for the largest UDP datagram"""
+
+    def __init__(self, size=MAX_DATAGRAM):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def recvfrom(self, sock):
+        received, addr = sock.recvfrom_into(self.buffer)
+        return bytes(self.view[:received]), addr
+
+    def recv_batch(self, sock, max_datagrams=64):
+        """Block for one datagram, then drain up to max_datagrams already queued without blocking"""
+        received, _ = sock.recvfrom_into(self.buffer)
+        datagrams = [bytes(self.view[:received])]
+        while len(datagrams) < max_datagrams:
+            try:
+                received, _ = sock.recvfrom_into(self.buffer, 0, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            datagrams.append(bytes(self.view[:received]))
+        return datagrams
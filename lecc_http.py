@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lecc_batcher import MicroBatcher
+
+
+class HttpSender(MicroBatcher):
+    """Keep-alive HTTP session for a module, with optional coalescing into batched POSTs"""
+
+    def __init__(self, module, pool_size=4):
+        super().__init__(module, module.config.get("batch_size", 100), module.config.get("batch_window", 0.01))
+        self.url = module.config["url"]
+        # Probed instead of the data route, which only answers POST
+        self.health_url = module.config.get("health_url") or urljoin(self.url, "/health")
+        self.batch_url = module.config.get("batch_url")
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def post(self, payload):
+        """Send one encoded message synchronously; returns the response"""
+        response = self.session.post(self.url, data=payload, headers={"Content-Type": "application/json"}, timeout=5)
+        if response.status_code != 200:
+            raise Exception(f"HTTP failure: {response.status_code}")
+        return response
+
+    def probe(self, timeout=1.0):
+        """Any HTTP response means the server is up"""
+        self.session.get(self.health_url, timeout=timeout)
+        return True
+
+    def flush(self, batch):
+        body = b"\n".join(payload for _, payload in batch)
+        try:
+            response = self.session.post(self.batch_url, data=body,
+                                         headers={"Content-Type": "application/x-ndjson"}, timeout=5)
+            if response.status_code != 200:
+                raise Exception(f"HTTP failure: {response.status_code}")
+        except Exception as e:
+            self.module.record_failure(e, [message for message, _ in batch], silent=True)
+            return
+        self.module.record_success()
+        self.module.sent_total.inc(len(batch))
+
+    def close(self):
+        self.session.close()
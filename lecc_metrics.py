@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import threading
+
+# Fixed export buckets (seconds) so Prometheus series stay comparable across scrapes
+EXPORT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic count, or a callback reading a counter kept elsewhere"""
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge:
+    """Settable value, or a callback evaluated at scrape time"""
+
+    def __init__(self, function=None):
+        self.value = 0.0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    """HDR-style log-linear histogram over integer microseconds.
+
+    Each power of two is split into 2**(SIGNIFICANT_BITS - 1) linear buckets, so
+    every recorded value is kept to within ~3% with a few hundred counters.
+    """
+    SIGNIFICANT_BITS = 6
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, micros):
+        if micros < (1 << cls.SIGNIFICANT_BITS):
+            return micros
+        shift = micros.bit_length() - cls.SIGNIFICANT_BITS
+        return (shift << (cls.SIGNIFICANT_BITS - 1)) + (micros >> shift)
+
+    @classmethod
+    def _upper(cls, index):
+        """Exclusive upper bound of a bucket, in microseconds"""
+        if index < (1 << cls.SIGNIFICANT_BITS):
+            return index + 1
+        shift = (index >> (cls.SIGNIFICANT_BITS - 1)) - 1
+        mantissa = index - (shift << (cls.SIGNIFICANT_BITS - 1))
+        return (mantissa + 1) << shift
+
+    def observe(self, seconds):
+        micros = max(0, int(seconds * 1000000))
+        index = self._index(micros)
+        with self.lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def quantile(self, q):
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for index in sorted(self.counts):
+                seen += self.counts[index]
+                if seen >= rank:
+                    return min(self._upper(index) / 1000000, self.max)
+            return self.max
+
+    def cumulative(self, bounds=EXPORT_BUCKETS):
+        with self.lock:
+            items = sorted(self.counts.items())
+        result = []
+        seen = 0
+        position = 0
+        for bound in bounds:
+            while position < len(items) and self._upper(items[position][0]) <= bound * 1000000:
+                seen += items[position][1]
+                position += 1
+            result.append((bound, seen))
+        return result
+
+    def merge(self, other):
+        """Fold another histogram's samples into this one, e.g. to aggregate labelled series"""
+        with other.lock:
+            counts = dict(other.counts)
+            count, total, low, high = other.count, other.total, other.min, other.max
+        if not count:
+            return
+        with self.lock:
+            for index, seen in counts.items():
+                self.counts[index] = self.counts.get(index, 0) + seen
+            self.count += count
+            self.total += total
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+    def snapshot(self):
+        result = {"count": self.count, "sum": self.total, "min": self.min, "max": self.max}
+        for q in QUANTILES:
+            result[f"p{q * 100:g}"] = self.quantile(q)
+        return result
+
+
+class MetricsRegistry:
+    """Named metric families with labels, rendered as Prometheus text or a dict snapshot"""
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        family = self.families.get(name)
+        if family is None or key not in family["series"]:
+            with self.lock:
+                family = self.families.setdefault(name, {"kind": kind, "help": help_text, "series": {}})
+                if key not in family["series"]:
+                    family["series"][key] = factory()
+        return family["series"][key]
+
+    def counter(self, name, help_text="", function=None, **labels):
+        return self._get("counter", name, help_text, labels, lambda: Counter(function))
+
+    def gauge(self, name, help_text="", function=None, **labels):
+        return self._get("gauge", name, help_text, labels, lambda: Gauge(function))
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get("histogram", name, help_text, labels, Histogram)
+
+    def snapshot(self):
+        """Plain-dict view of every series: {name: {label string: value or histogram summary}}"""
+        result = {}
+        for name, family in list(self.families.items()):
+            series = {}
+            for key, metric in list(family["series"].items()):
+                label = _labels_text(key)
+                series[label] = metric.snapshot() if family["kind"] == "histogram" else metric.get()
+            result[name] = series
+        return result
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, family in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            for key, metric in sorted(family["series"].items()):
+                if family["kind"] != "histogram":
+                    lines.append(f"{name}{_labels_text(key)} {metric.get()}")
+                    continue
+                for bound, seen in metric.cumulative():
+                    lines.append(f"{name}_bucket{_labels_text(key + (('le', repr(bound)),))} {seen}")
+                lines.append(f"{name}_bucket{_labels_text(key + (('le', '+Inf'),))} {metric.count}")
+                lines.append(f"{name}_sum{_labels_text(key)} {metric.total}")
+                lines.append(f"{name}_count{_labels_text(key)} {metric.count}")
+        return "\n".join(lines) + "\n"
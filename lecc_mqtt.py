@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+import itertools
+import queue
+import socket
+import struct
+import threading
+
+# Control packet types (MQTT 3.1.1, section 2.2.1)
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+PROTOCOL_LEVELS = (3, 4)  # MQTT 3.1 ("MQIsdp") and 3.1.1
+UINT16 = struct.Struct("!H")
+MAX_ROUTES = 10000
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT filter matching: '+' is one level, a trailing '#' is any number (including none)"""
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False  # Wildcards at the first level never match $SYS-style topics
+    levels = topic.split("/")
+    for i, part in enumerate(topic_filter.split("/")):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(topic_filter.split("/")) == len(levels)
+
+
+def _encode_length(length):
+    out = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _read_length(reader):
+    length = shift = 0
+    while True:
+        byte = reader.read(1)
+        if not byte:
+            raise ValueError("Connection closed mid-packet")
+        length |= (byte[0] & 0x7F) << shift
+        if not byte[0] & 0x80:
+            return length
+        shift += 7
+        if shift > 21:
+            raise ValueError("Malformed remaining length")
+
+
+def _encode_string(text):
+    data = text.encode()
+    return UINT16.pack(len(data)) + data
+
+
+def _read_string(body, pos):
+    size, = UINT16.unpack_from(body, pos)
+    pos += UINT16.size
+    return body[pos:pos + size].decode(), pos + size
+
+
+def publish_header(topic, payload_size, qos=0, retain=False, packet_id=None):
+    """Fixed and variable header of a PUBLISH; the payload follows it on the wire unchanged"""
+    variable = _encode_string(topic) + (UINT16.pack(packet_id) if qos else b"")
+    return bytes([PUBLISH << 4 | qos << 1 | int(retain)]) + _encode_length(len(variable) + payload_size) + variable
+
+
+def _sendall(sock, buffers):
+    """sendall() over a list of buffers with one sendmsg() per pass, without joining them"""
+    views = [memoryview(buffer) for buffer in buffers if buffer]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+class _LocalSubscriber:
+    """In-process subscriber: the callback gets the publisher's payload object itself"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def deliver(self, topic, payload, qos, retain):
+        self.callback(topic, payload, qos, retain)
+
+
+class _Session:
+    """One TCP client: a reader thread handling its packets and a writer thread draining its outbox"""
+
+    def __init__(self, broker, sock, max_queued):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = None
+        self.will = None
+        self.open = True
+        self.lock = threading.Lock()
+        # (header, payload) pairs; payloads are shared with every other subscriber
+        self.outbox = queue.Queue(max_queued)
+        self.packet_ids = itertools.cycle(range(1, 65536))
+
+    def start(self):
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._write_loop, daemon=True).start()
+
+    def deliver(self, topic, payload, qos, retain):
+        packet_id = next(self.packet_ids) if qos else None
+        item = (publish_header(topic, len(payload), qos, retain, packet_id), payload)
+        if not qos:
+            try:
+                self.outbox.put_nowait(item)
+            except queue.Full:
+                self.broker.dropped += 1  # QoS 0 to a subscriber that cannot keep up
+            return
+        self.send(*item)
+
+    def send(self, *buffers):
+        """Queue a packet, waiting at most the broker's send_timeout for room.
+
+        Publishers (e.g. the core's dispatch thread) call this, so a subscriber
+        that stays full that long is disconnected instead of stalling them.
+        """
+        if not self.open:
+            return
+        try:
+            self.outbox.put(buffers, timeout=self.broker.send_timeout)
+        except queue.Full:
+            self.broker.dropped += 1
+            print(f"MQTT broker: disconnecting {self.client_id}, outbox full for {self.broker.send_timeout}s")
+            self.close()
+
+    def _write_loop(self):
+        while self.open:
+            try:
+                buffers = list(self.outbox.get(timeout=0.5))
+            except queue.Empty:
+                continue
+            # Everything already queued goes out in the same sendmsg() call
+            while len(buffers) < 128:
+                try:
+                    buffers.extend(self.outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                _sendall(self.sock, buffers)
+            except OSError:
+                break
+        self.close()
+
+    def _read_loop(self):
+        reader = self.sock.makefile("rb")
+        try:
+            while self.open and self.broker.running:
+                header = reader.read(1)
+                if not header:
+                    break
+                length = _read_length(reader)
+                body = reader.read(length) if length else b""
+                if len(body) < length:
+                    break
+                if header[0] >> 4 == DISCONNECT:
+                    self.will = None  # Clean disconnect: the will is discarded
+                    break
+                self.handle(header[0] >> 4, header[0] & 0x0F, body)
+        except (OSError, ValueError, IndexError, struct.error):
+            pass  # Closed, timed out past keepalive, or a protocol error
+        finally:
+            reader.close()
+            self.close()
+            if self.will and self.broker.running:
+                self.broker.publish(*self.will)
+
+    def handle(self, packet_type, flags, body):
+        if self.client_id is None and packet_type != CONNECT:
+            raise ValueError("First packet must be CONNECT")
+        if packet_type == CONNECT:
+            self._connect(body)
+        elif packet_type == PUBLISH:
+            self._publish(flags, body)
+        elif packet_type == PUBACK:
+            pass  # Clean sessions only: nothing is retransmitted, so there is nothing to release
+        elif packet_type == SUBSCRIBE:
+            self._subscribe(body)
+        elif packet_type == UNSUBSCRIBE:
+            self._unsubscribe(body)
+        elif packet_type == PINGREQ:
+            self.send(bytes([PINGRESP << 4, 0]))
+        else:
+            raise ValueError(f"Unsupported packet type {packet_type}")
+
+    def _connect(self, body):
+        _, pos = _read_string(body, 0)
+        level, flags = body[pos], body[pos + 1]
+        keepalive, = UINT16.unpack_from(body, pos + 2)
+        if level not in PROTOCOL_LEVELS:
+            self.sock.sendall(bytes([CONNACK << 4, 2, 0, 1]))  # Unacceptable protocol version
+            raise ValueError(f"Unsupported MQTT protocol level {level}")
+        self.client_id, pos = _read_string(body, pos + 4)
+        if flags & 0x04:
+            will_topic, pos = _read_string(body, pos)
+            size, = UINT16.unpack_from(body, pos)
+            pos += UINT16.size
+            self.will = (will_topic, body[pos:pos + size], min((flags >> 3) & 0x03, 1), bool(flags & 0x20))
+        if keepalive:
+            # A client silent for 1.5 keepalive periods is gone (MQTT 3.1.1, section 3.1.2.10)
+            self.sock.settimeout(keepalive * 1.5)
+        self.send(bytes([CONNACK << 4, 2, 0, 0]))
+
+    def _publish(self, flags, body):
+        qos = (flags >> 1) & 0x03
+        if qos > 1:
+            raise ValueError("QoS 2 is not supported")
+        topic, pos = _read_string(body, 0)
+        if qos:
+            packet_id, = UINT16.unpack_from(body, pos)
+            pos += UINT16.size
+        self.broker.publish(topic, body[pos:], qos, bool(flags & 0x01))
+        if qos:
+            self.send(bytes([PUBACK << 4, 2]) + UINT16.pack(packet_id))
+
+    def _subscribe(self, body):
+        packet_id, = UINT16.unpack_from(body, 0)
+        pos = UINT16.size
+        granted = []
+        while pos < len(body):
+            topic_filter, pos = _read_string(body, pos)
+            granted.append((topic_filter, min(body[pos] & 0x03, 1)))
+            pos += 1
+        if not granted:
+            raise ValueError("SUBSCRIBE without topic filters")
+        # SUBACK is queued before any retained message the new subscriptions trigger
+        self.send(bytes([SUBACK << 4]) + _encode_length(UINT16.size + len(granted)) + UINT16.pack(packet_id)
+                  + bytes(qos for _, qos in granted))
+        for topic_filter, qos in granted:
+            self.broker.add_subscriber(topic_filter, self, qos)
+
+    def _unsubscribe(self, body):
+        packet_id, = UINT16.unpack_from(body, 0)
+        pos = UINT16.size
+        while pos < len(body):
+            topic_filter, pos = _read_string(body, pos)
+            self.broker.unsubscribe(self, topic_filter)
+        self.send(bytes([UNSUBACK << 4, 2]) + UINT16.pack(packet_id))
+
+    def close(self):
+        with self.lock:
+            if not self.open:
+                return
+            self.open = False
+        self.broker.unsubscribe(self)
+        self.broker.sessions.discard(self)
+        try:
+            # shutdown() wakes the reader blocked in recv(), close() alone does not
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class MqttBroker:
+    """Minimal MQTT 3.1.1 broker shared by TCP clients (e.g. paho) and in-process subscribers.
+
+    Supports QoS 0 and 1, '+'/'#' wildcards, retained messages and last wills.
+    Sessions are always clean, and QoS 2 publishes are refused. A published
+    payload is a single bytes object that every subscriber's callback or
+    outbox references; only the PUBLISH header is built per subscriber.
+    """
+
+    def __init__(self, max_queued=10000, send_timeout=1.0):
+        self.max_queued = max_queued
+        self.send_timeout = send_timeout
+        self.subscriptions = {}  # topic filter -> {subscriber: granted qos}
+        self.retained = {}  # topic -> (payload, qos)
+        self.routes = {}  # topic -> [(subscriber, qos)], cleared whenever subscriptions change
+        self.sessions = set()
+        self.lock = threading.Lock()
+        self.server_socket = None
+        self.running = True
+        self.published = 0
+        self.dropped = 0
+
+    def listen(self, host="127.0.0.1", port=1883):
+        """Accept MQTT clients on host:port; returns the bound address"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, port))
+            sock.listen(128)
+        except OSError:
+            sock.close()
+            raise
+        self.server_socket = sock
+        threading.Thread(target=self._accept, args=(sock,), daemon=True).start()
+        return sock.getsockname()
+
+    def _accept(self, server_socket):
+        while self.running:
+            try:
+                conn, addr = server_socket.accept()
+            except OSError:
+                break  # Broker closed
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(self, conn, self.max_queued)
+            self.sessions.add(session)
+            session.start()
+
+    def subscribe(self, topic_filter, callback, qos=0):
+        """Call callback(topic, payload, qos, retain) for every matching publish; returns a handle for unsubscribe"""
+        subscriber = _LocalSubscriber(callback)
+        self.add_subscriber(topic_filter, subscriber, qos)
+        return subscriber
+
+    def add_subscriber(self, topic_filter, subscriber, qos):
+        with self.lock:
+            self.subscriptions.setdefault(topic_filter, {})[subscriber] = qos
+            self.routes.clear()
+            retained = [(topic, payload, min(qos, retained_qos)) for topic, (payload, retained_qos) in self.retained.items()
+                        if topic_matches(topic_filter, topic)]
+        for topic, payload, granted in retained:
+            subscriber.deliver(topic, payload, granted, True)
+
+    def unsubscribe(self, subscriber, topic_filter=None):
+        """Drop one of subscriber's filters, or all of them"""
+        with self.lock:
+            for candidate in [topic_filter] if topic_filter is not None else list(self.subscriptions):
+                subscribers = self.subscriptions.get(candidate)
+                if subscribers and subscriber in subscribers:
+                    del subscribers[subscriber]
+                    if not subscribers:
+                        del self.subscriptions[candidate]
+            self.routes.clear()
+
+    def _route(self, topic):
+        with self.lock:
+            route = self.routes.get(topic)
+            if route is None:
+                # Overlapping filters deliver once per subscriber, at the highest granted QoS
+                matched = {}
+                for topic_filter, subscribers in self.subscriptions.items():
+                    if topic_matches(topic_filter, topic):
+                        for subscriber, qos in subscribers.items():
+                            matched[subscriber] = max(qos, matched.get(subscriber, 0))
+                if len(self.routes) >= MAX_ROUTES:
+                    self.routes.clear()
+                route = self.routes[topic] = list(matched.items())
+        return route
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Fan payload out to every matching subscriber, handing all of them the same object"""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif not isinstance(payload, bytes):
+            payload = bytes(payload)  # Shared by reference, so it must be immutable
+        if retain:
+            with self.lock:
+                if payload:
+                    self.retained[topic] = (payload, qos)
+                else:
+                    self.retained.pop(topic, None)  # An empty retained publish clears the topic
+        self.published += 1
+        for subscriber, granted in self._route(topic):
+            try:
+                subscriber.deliver(topic, payload, min(qos, granted), False)
+            except Exception:
+                self.dropped += 1
+
+    def close(self):
+        self.running = False
+        if self.server_socket is not None:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+            self.server_socket = None
+        for session in list(self.sessions):
+            session.close()
+        with self.lock:
+            self.subscriptions.clear()
+            self.routes.clear()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import select
+import socket
+import threading
+import time
+
+
+class ConnectionPool:
+    """Long-lived stream connections reused across sends, keyed by (host, port)"""
+
+    def __init__(self, max_per_host=4, max_idle=30.0, connect_timeout=5.0):
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.running = True
+        self.reaper = None
+
+    def _connect(self, addr):
+        sock = socket.create_connection(addr, timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return sock
+
+    def _healthy(self, sock):
+        # Listeners never write back, so a readable socket means EOF or a reset
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return not readable
+        except (OSError, ValueError):
+            return False
+
+    def acquire(self, addr):
+        """Return (socket, reused) for addr, reconnecting if no healthy idle socket is left"""
+        now = time.monotonic()
+        with self.lock:
+            connections = self.idle.get(addr, [])
+            while connections:
+                sock, last_used = connections.pop()
+                if now - last_used <= self.max_idle and self._healthy(sock):
+                    return sock, True
+                sock.close()
+        self._start_reaper()
+        return self._connect(addr), False
+
+    def release(self, addr, sock):
+        with self.lock:
+            connections = self.idle.setdefault(addr, [])
+            if self.running and len(connections) < self.max_per_host:
+                connections.append((sock, time.monotonic()))
+                return
+        sock.close()
+
+    def send(self, addr, data):
+        """Send data over a pooled connection, retrying once on a stale socket"""
+        while True:
+            sock, reused = self.acquire(addr)
+            try:
+                sock.sendall(data)
+            except OSError:
+                sock.close()
+                if reused:
+                    continue
+                raise
+            self.release(addr, sock)
+            return
+
+    def evict_idle(self):
+        """Close connections that have been idle longer than max_idle"""
+        now = time.monotonic()
+        with self.lock:
+            for addr, connections in self.idle.items():
+                keep = []
+                for sock, last_used in connections:
+                    if now - last_used <= self.max_idle and self._healthy(sock):
+                        keep.append((sock, last_used))
+                    else:
+                        sock.close()
+                self.idle[addr] = keep
+
+    def _start_reaper(self):
+        with self.lock:
+            if self.reaper is not None:
+                return
+            self.reaper = threading.Thread(target=self._reap, daemon=True)
+        self.reaper.start()
+
+    def _reap(self):
+        while self.running:
+            time.sleep(self.max_idle / 2)
+            self.evict_idle()
+
+    def close(self):
+        self.running = False
+        with self.lock:
+            for connections in self.idle.values():
+                for sock, _ in connections:
+                    sock.close()
+            self.idle.clear()
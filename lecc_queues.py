@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import collections
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+from lecc_store import DurableQueue
+
+QUEUE_POLICIES = ("block", "drop_oldest", "drop_newest", "spill")
+
+
+class BoundedQueue:
+    """queue.Queue replacement with a capacity and an overload policy.
+
+    block: producers wait for room (listeners stop reading, so the kernel pushes back)
+    drop_oldest / drop_newest: keep the newest or oldest capacity messages
+    spill: overflow goes to a DurableQueue on disk and is read back in order
+    """
+
+    def __init__(self, capacity=10000, policy="block", spill_dir=None, name="queue"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.name = name
+        self.items = collections.deque()
+        self.spill = None
+        self.spill_temp = False
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.delayed = 0
+        self.delayed_seconds = 0.0
+        self.spilled = 0
+        self.high_watermark = 0
+
+    def _spilled(self):
+        return self.spill is not None and not self.spill.empty()
+
+    def _size(self):
+        return len(self.items) + (self.spill.qsize() if self.spill is not None else 0)
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if self.policy == "spill" and (len(self.items) >= self.capacity or self._spilled()):
+                # Once spilling, everything goes to disk until it drains so order is kept
+                if self.spill is None:
+                    self._open_spill()
+                self.spill.put(item)
+                self.spilled += 1
+            elif len(self.items) >= self.capacity:
+                if self.policy == "drop_newest":
+                    self.dropped_newest += 1
+                    return
+                if self.policy == "drop_oldest":
+                    self.items.popleft()
+                    self.dropped_oldest += 1
+                else:
+                    if not block:
+                        raise queue.Full
+                    started = time.monotonic()
+                    self.delayed += 1
+                    deadline = None if timeout is None else started + timeout
+                    while len(self.items) >= self.capacity:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.delayed_seconds += time.monotonic() - started
+                            raise queue.Full
+                        self.not_full.wait(remaining)
+                    self.delayed_seconds += time.monotonic() - started
+                self.items.append(item)
+            else:
+                self.items.append(item)
+            self.high_watermark = max(self.high_watermark, self._size())
+            self.not_empty.notify()
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self.items and not self._spilled():
+                if not block:
+                    raise queue.Empty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self.not_empty.wait(remaining)
+            if self.items:
+                item = self.items.popleft()
+            else:
+                item = self.spill.get_nowait()
+                self.spill.task_done()
+                if self.spill_temp and self.spill.empty():
+                    # Nothing can replay a temp dir, so it goes as soon as it drains
+                    self._close_spill()
+            self.not_full.notify()
+            return item
+
+    def _open_spill(self):
+        self.spill_temp = not self.spill_dir
+        self.spill = DurableQueue(self.spill_dir or tempfile.mkdtemp(prefix=f"lecc-{self.name}-"))
+
+    def _close_spill(self):
+        self.spill.close()
+        if self.spill_temp:
+            shutil.rmtree(self.spill.path, ignore_errors=True)
+        self.spill = None
+
+    def set_spill_dir(self, path):
+        """Spill to path from now on, replaying whatever a previous run left there"""
+        with self.lock:
+            self.spill_dir = path
+            if self.spill is None and os.path.isdir(path):
+                self._open_spill()
+                if self.spill.empty():
+                    self._close_spill()
+                else:
+                    self.not_empty.notify_all()
+
+    def close(self):
+        """Flush a configured spill dir for the next run; delete a temp one"""
+        with self.lock:
+            if self.spill is not None:
+                self._close_spill()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        pass
+
+    def wait_writable(self, timeout=None):
+        """Backpressure for listeners: with the block policy, wait until there is room"""
+        if self.policy != "block":
+            return True
+        with self.not_full:
+            return self.not_full.wait_for(lambda: len(self.items) < self.capacity, timeout)
+
+    def note_dropped(self, oldest=False):
+        """Count a message a listener discarded because its own buffer was full"""
+        with self.lock:
+            if oldest:
+                self.dropped_oldest += 1
+            else:
+                self.dropped_newest += 1
+
+    def qsize(self):
+        with self.lock:
+            return self._size()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def full(self):
+        with self.lock:
+            return len(self.items) >= self.capacity
+
+    def stats(self):
+        with self.lock:
+            return {"depth": self._size(), "capacity": self.capacity, "policy": self.policy,
+                    "high_watermark": self.high_watermark, "dropped_oldest": self.dropped_oldest,
+                    "dropped_newest": self.dropped_newest, "delayed": self.delayed,
+                    "delayed_seconds": self.delayed_seconds, "spilled": self.spilled}
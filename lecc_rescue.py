@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+
+
+class TokenBucket:
+    """Classic token bucket: rate tokens per second, holding at most burst tokens"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count):
+        """Block until at least one token is available and take up to count of them"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    granted = int(min(count, self.tokens))
+                    self.tokens -= granted
+                    return granted
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RescueScheduler:
+    """Drains failed-message backlogs in batches as soon as a fallback is live.
+
+    Targets come from core.rescue_targets(protocol). Every fallback target has
+    its own token bucket so recovery traffic cannot flood the surviving link,
+    and backlogs are drained round-robin, each getting as many batches per
+    round as its scheduling class weight.
+    """
+
+    def __init__(self, core, batch_size=256, rate=1000.0, burst=None, interval=5.0, report_interval=1.0, rates=None):
+        self.core = core
+        self.batch_size = batch_size
+        self.rate = rate
+        self.burst = burst
+        # Per-target overrides of rate (messages per second), e.g. {"bluetooth": 50}
+        self.rates = dict(rates or {})
+        self.interval = interval
+        self.report_interval = report_interval
+        self.buckets = {}
+        self.stats = {}
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.last_report = 0.0
+        core.availability_listeners.append(self._on_availability_change)
+
+    def _on_availability_change(self, module, available):
+        if available:
+            self.wake()
+
+    def wake(self):
+        """Start a drain pass now instead of at the next interval"""
+        self.wakeup.set()
+
+    def bucket(self, target):
+        bucket = self.buckets.get(target)
+        if bucket is None:
+            bucket = self.buckets[target] = TokenBucket(self.rates.get(target, self.rate), self.burst)
+        return bucket
+
+    def run(self):
+        while self.core.running:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.drain_all()
+
+    def _class_of(self, protocol):
+        classes = self.core.scheduler.classes
+        return classes.get(self.core.protocol_class(protocol)) or classes[self.core.scheduler.default_class]
+
+    def drain_all(self):
+        """Weighted round-robin over backlogs, higher-priority classes first in every round"""
+        with self.lock:
+            while self.core.running:
+                progressed = False
+                backlogs = sorted(self.core.modules.items(), key=lambda item: self._class_of(item[0]).priority)
+                for protocol, module in backlogs:
+                    for _ in range(self._class_of(protocol).weight):
+                        if module.failed_message_queue.empty() or not self._drain_batch(protocol, module):
+                            break
+                        progressed = True
+                self._report()
+                if not progressed:
+                    return
+
+    def _drain_batch(self, protocol, module):
+        targets = [t for t in self.core.rescue_targets(protocol) if self.core.modules[t].available]
+        if not targets:
+            return False
+        target = targets[0]
+        target_module = self.core.modules[target]
+        # Tokens are only spent on messages that are actually waiting
+        granted = self.bucket(target).take(max(1, min(self.batch_size, module.failed_message_queue.qsize())))
+        rescue_seconds = self.core.metrics.histogram("lecc_rescue_seconds", "Time to hand a rescued message to its fallback",
+                                                     protocol=protocol)
+        sent = 0
+        for _ in range(granted):
+            if not target_module.available:
+                break
+            try:
+                msg = module.failed_message_queue.get_nowait()
+            except queue.Empty:
+                break
+            # Acknowledged once handed to the fallback; a failed send re-queues it there
+            module.failed_message_queue.task_done()
+            msg.setdefault("masked_history", []).append(f"rescue_{target}")
+            started = time.perf_counter()
+            target_module.send(msg, silent=True)
+            rescue_seconds.observe(time.perf_counter() - started)
+            sent += 1
+        self.core.metrics.counter("lecc_rescued_total", "Backlogged messages handed to a fallback",
+                                  protocol=protocol).inc(sent)
+        self._record(protocol, target, sent, module.failed_message_queue.qsize())
+        return sent > 0
+
+    def _record(self, protocol, target, sent, remaining):
+        now = time.monotonic()
+        stats = self.stats.get(protocol)
+        if stats is None:
+            stats = self.stats[protocol] = {"target": target, "drained": 0, "remaining": remaining,
+                                            "rate": 0.0, "eta": None, "started": now, "updated": now}
+        elapsed = now - stats["updated"]
+        if elapsed > 0 and sent:
+            # Exponentially weighted drain rate, so the ETA follows rate limit changes
+            current = sent / elapsed
+            stats["rate"] = current if not stats["rate"] else 0.8 * stats["rate"] + 0.2 * current
+        stats.update(target=target, remaining=remaining, updated=now)
+        stats["drained"] += sent
+        stats["eta"] = remaining / stats["rate"] if stats["rate"] else None
+
+    def progress(self):
+        """Snapshot of drain progress per backlogged protocol"""
+        return {protocol: dict(stats) for protocol, stats in self.stats.items()}
+
+    def _report(self):
+        now = time.monotonic()
+        if now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        for protocol, stats in self.stats.items():
+            if stats["remaining"] or stats["updated"] > now - self.report_interval:
+                eta = f"{stats['eta']:.1f}s" if stats["eta"] is not None else "unknown"
+                print(f"Rescue {protocol} via {stats['target']}: {stats['drained']} drained, "
+                      f"{stats['remaining']} remaining, {stats['rate']:.0f} msg/s, ETA {eta}")
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from types import MappingProxyType
+
+
+class RoutingTable:
+    """Immutable snapshot of live targets, swapped wholesale on availability events.
+
+    The send path only reads the current snapshot, so it never has to scan
+    modules or take a lock per message.
+    """
+    __slots__ = ("version", "live", "modules", "roles")
+
+    def __init__(self, version=0, modules=None, roles=None):
+        self.version = version
+        self.modules = MappingProxyType(dict(modules or {}))
+        self.live = tuple(self.modules)
+        self.roles = MappingProxyType({role: tuple(targets) for role, targets in (roles or {}).items()})
+
+    def targets(self, role):
+        """Ordered live targets for a role (empty when the role is offline)"""
+        return self.roles.get(role, ())
+
+    def __repr__(self):
+        return f"RoutingTable(v{self.version}, live={list(self.live)}, roles={dict(self.roles)})"
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+
+# Routed messages a class holds before put() refuses more (route_message then defers them)
+DEFAULT_MAX_QUEUE = 100000
+
+
+class TrafficClass:
+    """One scheduling class: lower priority values are served first"""
+
+    def __init__(self, name, priority=0, weight=1, latency_target=None, max_wait=None,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.name = name
+        self.priority = priority
+        self.weight = max(1, int(weight))
+        self.latency_target = latency_target
+        # Starvation guard: past this wait the class is served regardless of priority
+        self.max_wait = max_wait if max_wait is not None else (latency_target * 4 if latency_target else None)
+        self.max_queue = max_queue
+        self.queue = collections.deque()
+        self.credits = self.weight
+        self.served = 0
+        self.late = 0
+        self.dropped = 0
+        self.starved = 0
+        self.max_seen_wait = 0.0
+
+    def stats(self):
+        return {"priority": self.priority, "weight": self.weight, "queued": len(self.queue),
+                "served": self.served, "late": self.late, "dropped": self.dropped,
+                "starvation_promotions": self.starved, "max_wait": self.max_seen_wait,
+                "latency_target": self.latency_target}
+
+
+class PriorityScheduler:
+    """Multi-class scheduler between route_message and the module sends.
+
+    Classes are served in strict priority order; classes sharing a priority
+    split service by weight (weighted round robin), and any class whose oldest
+    message has waited past max_wait is promoted on every other pick so it
+    cannot starve.
+    """
+
+    def __init__(self, default_class="default"):
+        self.default_class = default_class
+        self.classes = {}
+        self.levels = []
+        self.promoted = False
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.configure([TrafficClass(default_class)])
+
+    def configure(self, classes):
+        """Replace the class table; messages already queued keep their place"""
+        with self.lock:
+            previous = self.classes
+            self.classes = {c.name: c for c in classes}
+            if self.default_class not in self.classes:
+                self.classes[self.default_class] = TrafficClass(self.default_class, priority=max(
+                    [c.priority for c in classes] or [0]) + 1)
+            for name, old in previous.items():
+                target = self.classes.get(name, self.classes[self.default_class])
+                target.queue.extend(old.queue)
+            levels = collections.defaultdict(list)
+            for traffic_class in self.classes.values():
+                levels[traffic_class.priority].append(traffic_class)
+            self.levels = [levels[p] for p in sorted(levels)]
+
+    def put(self, item, class_name=None):
+        """Queue an item; returns False when the class is at its queue limit"""
+        with self.not_empty:
+            traffic_class = self.classes.get(class_name) or self.classes[self.default_class]
+            if traffic_class.max_queue is not None and len(traffic_class.queue) >= traffic_class.max_queue:
+                traffic_class.dropped += 1
+                return False
+            traffic_class.queue.append((time.monotonic(), item))
+            self.not_empty.notify()
+            return True
+
+    def _select(self, now):
+        # Promotions alternate with strict picks so a starving backlog cannot
+        # turn around and block the top class in its turn
+        strict = self._strict_choice()
+        if self.promoted:
+            self.promoted = False
+            return strict
+        starving = [c for c in self.classes.values()
+                    if c.queue and c.max_wait is not None and now - c.queue[0][0] > c.max_wait]
+        if not starving:
+            return strict
+        traffic_class = max(starving, key=lambda c: (now - c.queue[0][0]) / c.max_wait)
+        if traffic_class is not strict:
+            traffic_class.starved += 1
+            self.promoted = True
+        return traffic_class
+
+    def _strict_choice(self):
+        for level in self.levels:
+            ready = [c for c in level if c.queue]
+            if not ready:
+                continue
+            if not any(c.credits > 0 for c in ready):
+                for c in level:
+                    c.credits = c.weight
+            for c in ready:
+                if c.credits > 0:
+                    return c
+        return None
+
+    def get(self, timeout=None):
+        """Block for the next (item, class_name) or return None on timeout"""
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not any(c.queue for c in self.classes.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.not_empty.wait(remaining)
+            now = time.monotonic()
+            traffic_class = self._select(now)
+            queued_at, item = traffic_class.queue.popleft()
+            traffic_class.credits -= 1
+            waited = now - queued_at
+            traffic_class.served += 1
+            traffic_class.max_seen_wait = max(traffic_class.max_seen_wait, waited)
+            if traffic_class.latency_target is not None and waited > traffic_class.latency_target:
+                traffic_class.late += 1
+            return item, traffic_class.name
+
+    def qsize(self):
+        with self.lock:
+            return sum(len(c.queue) for c in self.classes.values())
+
+    def stats(self):
+        with self.lock:
+            return {name: c.stats() for name, c in self.classes.items()}
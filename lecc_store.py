@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+# Record layout: length, crc32, payload. A zero length marks the end of written data
+# (segments are preallocated with zeros), so a torn write is never visible after a crash.
+RECORD_HEADER = struct.Struct("!II")
+CURSOR = struct.Struct("!QQ")
+SEGMENT_SUFFIX = ".log"
+
+
+class DurableQueue:
+    """Disk-backed store-and-forward queue built on an append-only segment log.
+
+    Drop-in replacement for queue.Queue as a failed_message_queue: get() hands
+    out entries in order and task_done() acknowledges the oldest one handed out.
+    Unacknowledged entries are replayed after a restart, fully acknowledged
+    segments are deleted, and only the write and read segments are mapped, so
+    memory stays at roughly two segments however long the outage lasts.
+    """
+
+    def __init__(self, path, segment_size=4 * 1024 * 1024, fsync_interval=0.05):
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.dirty = False
+        self.running = True
+        self.segments = {}
+        self.pending = collections.deque()
+        os.makedirs(path, exist_ok=True)
+        self.ack = self._load_cursor()
+        self._recover()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _segment_seqs(self):
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.path)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def _map(self, seq, size=None):
+        segment = self.segments.get(seq)
+        if segment is None:
+            with open(self._segment_path(seq), "a+b") as f:
+                if size is not None and os.fstat(f.fileno()).st_size < size:
+                    f.truncate(size)
+                segment = mmap.mmap(f.fileno(), 0)
+            self.segments[seq] = segment
+        return segment
+
+    def _unmap(self, seq):
+        segment = self.segments.pop(seq, None)
+        if segment is not None:
+            segment.flush()
+            segment.close()
+
+    def _records(self, seq, offset):
+        """Yield (offset, end, payload) for every valid record from offset on"""
+        segment = self._map(seq)
+        while offset + RECORD_HEADER.size <= len(segment):
+            length, crc = RECORD_HEADER.unpack_from(segment, offset)
+            end = offset + RECORD_HEADER.size + length
+            if length == 0 or end > len(segment):
+                return
+            payload = segment[offset + RECORD_HEADER.size:end]
+            if zlib.crc32(payload) != crc:
+                return
+            yield offset, end, payload
+            offset = end
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, "ack"), "rb") as f:
+                return CURSOR.unpack(f.read(CURSOR.size))
+        except (OSError, struct.error):
+            seqs = self._segment_seqs()
+            return (seqs[0] if seqs else 0, 0)
+
+    def _save_cursor(self):
+        tmp = os.path.join(self.path, "ack.tmp")
+        with open(tmp, "wb") as f:
+            f.write(CURSOR.pack(*self.ack))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, "ack"))
+
+    def _recover(self):
+        """Find the write position and count the entries still to be replayed"""
+        seqs = [seq for seq in self._segment_seqs() if seq >= self.ack[0]]
+        if not seqs:
+            self.ack = (self.ack[0], 0)
+        self.size = 0
+        self.bytes = 0
+        self.write = (self.ack[0], 0)
+        for seq in seqs:
+            start = self.ack[1] if seq == self.ack[0] else 0
+            end = start
+            for _, end, _ in self._records(seq, start):
+                self.size += 1
+            self.bytes += end - start
+            self.write = (seq, end)
+            if seq != seqs[-1]:
+                self._unmap(seq)
+        self.read = self.ack
+        self._map(self.write[0], self.segment_size)
+
+    def put(self, message, block=True, timeout=None):
+        payload = json.dumps(message).encode()
+        record = RECORD_HEADER.size + len(payload)
+        with self.not_empty:
+            seq, offset = self.write
+            segment = self._map(seq, self.segment_size)
+            if offset + record > len(segment):
+                if seq != self.read[0]:
+                    self._unmap(seq)
+                seq, offset = seq + 1, 0
+                segment = self._map(seq, max(self.segment_size, record + RECORD_HEADER.size))
+            # Payload first, header last: a crash mid-write leaves a zero header behind
+            segment[offset + RECORD_HEADER.size:offset + record] = payload
+            segment[offset:offset + RECORD_HEADER.size] = RECORD_HEADER.pack(len(payload), zlib.crc32(payload))
+            self.write = (seq, offset + record)
+            self.size += 1
+            self.bytes += record
+            self.dirty = True
+            self.not_empty.notify()
+
+    def put_nowait(self, message):
+        self.put(message, block=False)
+
+    def _next(self):
+        seq, offset = self.read
+        while True:
+            for _, end, payload in self._records(seq, offset):
+                self.read = (seq, end)
+                self.pending.append((seq, end, RECORD_HEADER.size + len(payload)))
+                return json.loads(payload)
+            if seq >= self.write[0]:
+                return None
+            self._unmap(seq)
+            seq, offset = seq + 1, 0
+            self.read = (seq, 0)
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.qsize_unlocked() == 0:
+                if not block:
+                    raise queue.Empty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self.not_empty.wait(remaining)
+            return self._next()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        """Acknowledge the oldest entry handed out by get()"""
+        with self.lock:
+            if not self.pending:
+                return
+            seq, end, record = self.pending.popleft()
+            self.ack = (seq, end)
+            self.size -= 1
+            self.bytes -= record
+            self.dirty = True
+
+    def qsize_unlocked(self):
+        return self.size - len(self.pending)
+
+    def qsize(self):
+        with self.lock:
+            return self.qsize_unlocked()
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def _flush_loop(self):
+        while self.running:
+            time.sleep(self.fsync_interval)
+            self.flush()
+
+    def flush(self):
+        """Batch fsync of appended records and the ack cursor, then compact"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            for segment in self.segments.values():
+                segment.flush()
+            self._save_cursor()
+            for seq in self._segment_seqs():
+                if seq < self.ack[0]:
+                    self._unmap(seq)
+                    os.remove(self._segment_path(seq))
+
+    def close(self):
+        self.running = False
+        self.flush()
+        with self.lock:
+            for seq in list(self.segments):
+                self._unmap(seq)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import threading
+import uuid
+
+
+class SharedAvailability:
+    """Module availability shared by every worker process through shared memory.
+
+    Each worker publishes its own transitions; a watcher thread in every worker
+    applies the others' to its modules, so all workers build the same routing
+    table and LeccFirewall picks the same role fallbacks everywhere.
+    """
+
+    def __init__(self, protocols, context=None):
+        context = context or multiprocessing.get_context("fork")
+        self.protocols = list(protocols)
+        self.index = {protocol: i for i, protocol in enumerate(self.protocols)}
+        self.flags = context.Array("b", len(self.protocols), lock=False)
+        self.version = context.Value("Q", 0, lock=False)
+        self.changed = context.Condition()
+
+    def publish(self, protocol, available):
+        index = self.index.get(protocol)
+        if index is None:
+            return
+        with self.changed:
+            if bool(self.flags[index]) == available:
+                return
+            self.flags[index] = int(available)
+            self.version.value += 1
+            self.changed.notify_all()
+
+    def snapshot(self):
+        with self.changed:
+            return {protocol: bool(self.flags[i]) for protocol, i in self.index.items()}
+
+    def attach(self, core):
+        """Publish core's transitions and follow everyone else's"""
+        core.availability_listeners.append(lambda module, available: self.publish(module.protocol, available))
+        threading.Thread(target=self._follow, args=(core,), daemon=True).start()
+
+    def _follow(self, core):
+        seen = None
+        while core.running:
+            with self.changed:
+                self.changed.wait_for(lambda: self.version.value != seen, timeout=1.0)
+                seen = self.version.value
+            for protocol, available in self.snapshot().items():
+                module = core.modules.get(protocol)
+                startup = core.startup.get(protocol)
+                if module is None or startup is None or not startup.done() or module.available == available:
+                    continue
+                # Another worker saw the change; the local prober keeps checking from here
+                if available:
+                    module.record_success()
+                else:
+                    module.breaker.trip()
+                    module.available = False
+
+
+def worker_configs(configs):
+    """Copy of the protocol configs with SO_REUSEPORT turned on for every listener"""
+    return {protocol: dict(config, reuse_port=True) for protocol, config in configs.items()}
+
+
+def run_workers(target, workers, protocols):
+    """Fork workers running target(worker_id, shared, node_id) and wait for all of them.
+
+    Workers share one node_id, so each drops the others' fan-out echoes as loops.
+    """
+    context = multiprocessing.get_context("fork")
+    shared = SharedAvailability(protocols, context)
+    node_id = uuid.uuid4().hex
+    processes = [context.Process(target=target, args=(worker_id, shared, node_id), name=f"lecc-worker-{worker_id}")
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"Started {workers} workers: {[process.pid for process in processes]} (supervisor {os.getpid()})")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Workers get the same SIGINT and shut themselves down
+        for process in processes:
+            process.join()
+    return [process.exitcode for process in processes]
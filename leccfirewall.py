@@ -7,19 +7,27 @@ import threading
 # Ensure the current directory is in the module search path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lecc import LECCCore, GenericModule, protocol_configs
-
-print("\033[1mLeccFirewall - Dynamic Communication Firewall\033[0m")
+from lecc_async import AsyncLECCCore
+from lecc_scheduler import TrafficClass
+from lecc_workers import run_workers, worker_configs
 
 class LeccFirewall(LECCCore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         # Define priority rules for protocol fallback
         self.priority_rules = {
             "critical": ["HTTP", "UDP", "TCP", "BLUETOOTH"],  # High-priority systems
             "secondary": ["TCP", "UDP", "BLUETOOTH"]          # Lower-priority systems
         }
+        # Scheduling policy per role: lower priority is served first, weight splits
+        # bandwidth within a priority, latency_target (s) and max_queue bound each class
+        self.class_policies = {
+            "critical": {"priority": 0, "weight": 4, "latency_target": 0.05, "max_queue": 10000},
+            "secondary": {"priority": 1, "weight": 1, "latency_target": 1.0, "max_queue": 50000}
+        }
         self.device_roles = {}
         self.action_protocol = {}
+        self.action_lock = threading.Lock()
 
     def assign_roles(self):
         """Assign roles to protocols based on their criticality"""
@@ -31,76 +39,150 @@ class LeccFirewall(LECCCore):
             "bluetooth": "secondary" # Mobile device backup
         }
         print("[LeccFirewall] Roles assigned: {}".format(self.device_roles))
+        self.scheduler.configure([TrafficClass(role, **self.class_policies.get(role, {}))
+                                  for role in self.priority_rules])
+        self.rebuild_routes()
+
+    def roles_routable(self):
+        """True once every assigned role has at least one live route"""
+        table = self.routing_table
+        return all(table.targets(role) for role in set(self.device_roles.values()))
+
+    def wait_for_routes(self, timeout=None):
+        """Wait until every role can route or all modules have started, whichever comes first"""
+        self.wait_until(lambda: self.roles_routable() or self.startup_complete(), timeout)
+        return self.roles_routable()
+
+    def protocol_class(self, protocol):
+        """Traffic is scheduled by the role of the protocol it came from"""
+        return self.device_roles.get(protocol)
 
     def scan_system(self):
         """Scan all modules to track availability"""
         print("[LeccFirewall] Scanning system...")
-        available = {p: m for p, m in self.modules.items() if m.available}
+        available = self.routing_table.modules
         for protocol in self.modules:
             status = "Available" if protocol in available else "Unavailable"
             emulated = self.modules[protocol].emulated
             print("  {}: {} - Emulated: {}".format(protocol, status, emulated))
         return available
 
-    def create_action_protocol(self, available_modules):
+    def compute_routes(self, live, changed, previous):
+        """Role -> ordered live targets, recomputing only the roles an event can affect"""
+        routes = dict(previous.roles) if previous is not None else {}
+        for role, rules in self.priority_rules.items():
+            targets = [p.lower() for p in rules]
+            if previous is None or changed in targets or role not in routes:
+                routes[role] = tuple(p for p in targets if p in live)
+        return routes
+
+    def on_availability_change(self, module, available):
+        """Apply a failure or recovery to the action protocol as soon as it is detected"""
+        super().on_availability_change(module, available)
+        if self.device_roles:
+            print("[LeccFirewall] {} is now {}".format(module.protocol, "available" if available else "unavailable"))
+            # Read under the action lock, not here: the table may be replaced before the lock is taken
+            self.create_action_protocol(None, verbose=False)
+
+    def create_action_protocol(self, available_modules, verbose=True):
         """Create a dynamic action protocol based on availability and priorities"""
-        print("[LeccFirewall] Creating action protocol...")
-        self.action_protocol.clear()
+        if verbose:
+            print("[LeccFirewall] Creating action protocol...")
+        # Racing events publish one at a time, each from the newest table, so an older mapping never wins
+        with self.action_lock:
+            return self._publish_action_protocol(available_modules, verbose)
+
+    def _publish_action_protocol(self, available_modules, verbose):
+        table = self.routing_table
+        if available_modules is None:
+            available_modules = table.modules
+        action_protocol = {}
 
         for protocol, role in self.device_roles.items():
-            if protocol in available_modules and available_modules[protocol].available:
-                self.action_protocol[protocol] = protocol
-                print("    Using {} directly".format(protocol))
+            if protocol in available_modules:
+                action_protocol[protocol] = protocol
+                if verbose:
+                    print("    Using {} directly".format(protocol))
             else:
-                for fallback_proto in self.priority_rules[role]:
-                    if fallback_proto.lower() in available_modules and available_modules[fallback_proto.lower()].available:
-                        self.action_protocol[protocol] = "{} (fallback)".format(fallback_proto.lower())
-                        print("    Using {} as fallback for {}".format(fallback_proto.lower(), protocol))
-                        break
+                fallbacks = [p for p in table.targets(role) if p in available_modules]
+                if fallbacks:
+                    action_protocol[protocol] = "{} (fallback)".format(fallbacks[0])
+                    if verbose:
+                        print("    Using {} as fallback for {}".format(fallbacks[0], protocol))
                 else:
-                    self.action_protocol[protocol] = "Offline"
-                    print("    {} offline, no fallbacks available".format(protocol))
+                    action_protocol[protocol] = "Offline"
+                    if verbose:
+                        print("    {} offline, no fallbacks available".format(protocol))
 
+        # Publish the new mapping in one assignment so readers never see a half-built dict
+        self.action_protocol = action_protocol
         print("  Current protocol: {}".format(self.action_protocol))
         return self.action_protocol
 
     def monitor_and_adapt(self):
         """Monitor the system and adapt the protocol in real-time"""
         while self.running:
-            time.sleep(5)  # Check every 5 seconds; adjust based on your needs
+            # Availability events update the routes immediately; this loop only wakes
+            # on a change (or every 5 seconds) to report status and drain queued messages
+            self.routes_changed.wait(5)
+            self.routes_changed.clear()
             print("[LeccFirewall] Monitoring changes...")
-            available = self.scan_system()
-            self.create_action_protocol(available)
+            self.scan_system()
             self.route_messages_with_protocol()
 
+    def rescue_targets(self, protocol):
+        """Drain a protocol's backlog through its current action protocol target"""
+        target_proto = self.action_protocol.get(protocol)
+        if target_proto is None:
+            return super().rescue_targets(protocol)
+        if target_proto == "Offline":
+            return []
+        return [target_proto.split()[0]]
+
     def route_messages_with_protocol(self):
         """Route messages using the current action protocol"""
-        for protocol, target_proto in self.action_protocol.items():
-            if target_proto != "Offline" and not self.modules[protocol].failed_message_queue.empty():
-                msg = self.modules[protocol].failed_message_queue.get()
-                target_protocol = target_proto.split()[0]
-                print("[LeccFirewall] Routing message from {} via {}".format(protocol, target_proto))
-                self.route_message(msg, target_protocol)
-
-def main():
-    # Initialize the firewall
-    firewall = LeccFirewall()
-
-    # Register protocols relevant to your system (customize as needed)
-    used_protocols = {
-        "http": protocol_configs["http"],        # E.g., payment terminals
-        "udp": protocol_configs["udp"],          # Local network backup
-        "tcp": protocol_configs["tcp"],          # Internal server
-        "bluetooth": protocol_configs["bluetooth"]  # Mobile device backup
-    }
-    for protocol, config in used_protocols.items():
+        # The rescue scheduler drains every backlog in rate-limited batches
+        self.rescue.wake()
+        for protocol, stats in self.rescue.progress().items():
+            if stats["remaining"]:
+                print("[LeccFirewall] Draining {} via {}: {} remaining".format(protocol, stats["target"], stats["remaining"]))
+
+class AsyncLeccFirewall(AsyncLECCCore, LeccFirewall):
+    """LeccFirewall running on the asyncio transport engine"""
+
+# Register protocols relevant to your system (customize as needed)
+used_protocols = {
+    "http": protocol_configs["http"],        # E.g., payment terminals
+    "udp": protocol_configs["udp"],          # Local network backup
+    "tcp": protocol_configs["tcp"],          # Internal server
+    "bluetooth": protocol_configs["bluetooth"]  # Mobile device backup
+}
+
+def run_firewall(worker_id=None, shared=None, node_id=None):
+    # Initialize the firewall (pass --async to run every endpoint on one event loop)
+    # Set LECC_STORE_DIR to keep failed messages on disk across restarts
+    firewall_class = AsyncLeccFirewall if "--async" in sys.argv else LeccFirewall
+    store_dir = os.environ.get("LECC_STORE_DIR")
+    configs = used_protocols
+    if worker_id is not None:
+        # Durable queues have a single writer, so every worker keeps its own
+        store_dir = store_dir and os.path.join(store_dir, "worker-{}".format(worker_id))
+        configs = worker_configs(used_protocols)
+    firewall = firewall_class(store_dir=store_dir, node_id=node_id)
+    if shared is not None:
+        shared.attach(firewall)
+
+    for protocol, config in configs.items():
         firewall.register_module(protocol, GenericModule(protocol, config))
 
     print("\033[1mInitializing LeccFirewall...\033[0m")
-    time.sleep(10)  # Wait for modules to initialize; adjust if needed
-
-    # Assign roles and start with initial protocol
+    # Modules start in parallel; routing begins as soon as every role has a live route.
+    # LECC_STARTUP_DEADLINE (seconds) caps the wait if some role never comes up.
     firewall.assign_roles()
+    if not firewall.wait_for_routes(float(os.environ.get("LECC_STARTUP_DEADLINE", 10))):
+        print("[LeccFirewall] Startup deadline reached, some roles have no live route yet")
+
+    # Start with the initial protocol
     available = firewall.scan_system()
     firewall.create_action_protocol(available)
 
@@ -115,8 +197,20 @@ def main():
     except KeyboardInterrupt:
         print("\n[LeccFirewall] Shutting down...")
         firewall.running = False
+        firewall.connection_pool.close()
         for module in firewall.modules.values():
             module.running = False
+            module.message_queue.close()
+            module.failed_message_queue.close()
+
+def main():
+    print("\033[1mLeccFirewall - Dynamic Communication Firewall\033[0m")
+    # Set LECC_WORKERS to shard ingest across processes sharing the listener ports (SO_REUSEPORT)
+    workers = int(os.environ.get("LECC_WORKERS", 1))
+    if workers > 1:
+        run_workers(run_firewall, workers, used_protocols)
+    else:
+        run_firewall()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from lecc_codec import (BINARY_MAGIC, HISTORY_KEY, EncodedMessage, decode_batch, decode_message, detect_codec,
+                        get_codec)
+
+MESSAGE = {"id": 7, "data": "héllo", "priority": -3, "ratio": 0.25, "flags": [True, False, None],
+           "nested": {"a": [1, 2, {"b": "c"}]}}
+
+
+@pytest.mark.parametrize("name", ["json", "binary"])
+def test_round_trip(name):
+    codec = get_codec(name)
+    assert codec.decode(codec.encode(MESSAGE)) == MESSAGE
+
+
+def test_binary_round_trips_bytes():
+    codec = get_codec("binary")
+    message = {"data": b"\x00\xffraw"}
+    assert codec.decode(codec.encode(message)) == message
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 63, -64, 127, 128, 2 ** 40, -(2 ** 40)])
+def test_binary_ints(value):
+    codec = get_codec("binary")
+    assert codec.decode(codec.encode({"data": value})) == {"data": value}
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("xml")
+
+
+def test_detect_codec():
+    assert detect_codec(get_codec("binary").encode(MESSAGE)).name == "binary"
+    assert detect_codec(get_codec("json").encode(MESSAGE)).name == "json"
+
+
+def test_every_truncated_binary_payload_raises_value_error():
+    payload = get_codec("binary").encode(MESSAGE)
+    for end in range(len(payload)):
+        with pytest.raises(ValueError):
+            get_codec("binary").decode(payload[:end])
+
+
+def test_binary_trailing_bytes():
+    with pytest.raises(ValueError):
+        get_codec("binary").decode(get_codec("binary").encode(MESSAGE) + b"\x00")
+
+
+def test_binary_rejects_json():
+    with pytest.raises(ValueError):
+        get_codec("binary").decode(json.dumps(MESSAGE).encode())
+
+
+@pytest.mark.parametrize("name", ["json", "binary"])
+def test_encoded_message_splices_history(name):
+    codec = get_codec(name)
+    message = dict(MESSAGE, **{HISTORY_KEY: ["stale"]})
+    encoded = EncodedMessage(message)
+    for history in (["tcp"], ["tcp", "udp"], []):
+        expected = dict(MESSAGE, **{HISTORY_KEY: history})
+        assert codec.decode(encoded.render(codec, history)) == expected
+
+
+def test_encoded_message_empty_body():
+    encoded = EncodedMessage({})
+    for codec in (get_codec("json"), get_codec("binary")):
+        assert codec.decode(encoded.render(codec, ["tcp"])) == {HISTORY_KEY: ["tcp"]}
+
+
+@pytest.mark.parametrize("name", ["json", "binary"])
+def test_decode_message_stamps_codec(name):
+    message = decode_message(get_codec(name).encode({"data": 1}))
+    assert message == {"data": 1, "codec": name}
+
+
+@pytest.mark.parametrize("payload", [b"[1, 2]", b'"text"', b'{"nodata": 1}', bytes([BINARY_MAGIC]), b"{"])
+def test_decode_message_rejects(payload):
+    with pytest.raises(ValueError):
+        decode_message(payload)
+
+
+def test_decode_batch_array_and_ndjson():
+    messages = [{"data": 1}, {"data": 2}]
+    expected = [{"data": 1, "codec": "json"}, {"data": 2, "codec": "json"}]
+    assert decode_batch(json.dumps(messages).encode()) == expected
+    ndjson = b"\n".join(json.dumps(m).encode() for m in messages) + b"\n\n"
+    assert decode_batch(ndjson) == expected
+
+
+@pytest.mark.parametrize("body", [b'[{"data": 1}, 2]', b'{"data": 1}\n{"nodata": 2}', b'{"data": 1}\nnot json'])
+def test_decode_batch_rejects_whole_batch(body):
+    with pytest.raises(ValueError):
+        decode_batch(body)
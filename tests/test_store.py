@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import queue
+
+import pytest
+
+from lecc_store import RECORD_HEADER, SEGMENT_SUFFIX, DurableQueue
+
+
+def drain(store):
+    messages = []
+    while not store.empty():
+        messages.append(store.get_nowait())
+        store.task_done()
+    return messages
+
+
+def segments(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+
+def test_put_get_in_order(tmp_path):
+    store = DurableQueue(str(tmp_path))
+    for i in range(5):
+        store.put({"id": i})
+    assert store.qsize() == 5
+    assert drain(store) == [{"id": i} for i in range(5)]
+    with pytest.raises(queue.Empty):
+        store.get_nowait()
+    store.close()
+
+
+def test_get_times_out_when_empty(tmp_path):
+    store = DurableQueue(str(tmp_path))
+    with pytest.raises(queue.Empty):
+        store.get(timeout=0.05)
+    store.close()
+
+
+def test_acknowledged_entries_are_not_replayed(tmp_path):
+    store = DurableQueue(str(tmp_path))
+    for i in range(5):
+        store.put({"id": i})
+    for _ in range(2):
+        store.get_nowait()
+        store.task_done()
+    store.close()
+
+    store = DurableQueue(str(tmp_path))
+    assert store.qsize() == 3
+    assert drain(store) == [{"id": 2}, {"id": 3}, {"id": 4}]
+    store.close()
+
+
+def test_unacknowledged_entries_are_replayed(tmp_path):
+    store = DurableQueue(str(tmp_path))
+    store.put({"id": 0})
+    store.put({"id": 1})
+    assert store.get_nowait() == {"id": 0}
+    store.close()
+
+    store = DurableQueue(str(tmp_path))
+    assert drain(store) == [{"id": 0}, {"id": 1}]
+    store.close()
+
+
+def test_restart_appends_after_existing_entries(tmp_path):
+    store = DurableQueue(str(tmp_path))
+    store.put({"id": 0})
+    store.close()
+
+    store = DurableQueue(str(tmp_path))
+    store.put({"id": 1})
+    assert drain(store) == [{"id": 0}, {"id": 1}]
+    store.close()
+
+
+def test_acknowledged_segments_are_compacted(tmp_path):
+    store = DurableQueue(str(tmp_path), segment_size=256)
+    for i in range(50):
+        store.put({"id": i, "data": "x" * 32})
+    assert len(segments(str(tmp_path))) > 1
+    assert drain(store) == [{"id": i, "data": "x" * 32} for i in range(50)]
+    store.flush()
+    assert len(segments(str(tmp_path))) == 1
+    store.close()
+
+    store = DurableQueue(str(tmp_path), segment_size=256)
+    assert store.empty()
+    store.close()
+
+
+def test_record_larger_than_a_segment(tmp_path):
+    store = DurableQueue(str(tmp_path), segment_size=64)
+    big = {"data": "y" * 1000}
+    store.put({"id": 0})
+    store.put(big)
+    store.put({"id": 2})
+    store.close()
+
+    store = DurableQueue(str(tmp_path), segment_size=64)
+    assert drain(store) == [{"id": 0}, big, {"id": 2}]
+    store.close()
+
+
+def write_three(path):
+    store = DurableQueue(path)
+    for i in range(3):
+        store.put({"id": i})
+    store.close()
+    segment = os.path.join(path, segments(path)[0])
+    record = RECORD_HEADER.size + len(json.dumps({"id": 0}).encode())
+    return segment, record
+
+
+def test_corrupt_record_ends_recovery(tmp_path):
+    segment, record = write_three(str(tmp_path))
+    with open(segment, "r+b") as f:
+        # Flip a payload byte of the last record: its crc no longer matches
+        f.seek(2 * record + RECORD_HEADER.size)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    store = DurableQueue(str(tmp_path))
+    assert drain(store) == [{"id": 0}, {"id": 1}]
+    store.close()
+
+
+def test_torn_write_is_not_visible(tmp_path):
+    segment, record = write_three(str(tmp_path))
+    with open(segment, "r+b") as f:
+        # A crash before the header of the last record was written leaves zeros in its place
+        f.seek(2 * record)
+        f.write(bytes(RECORD_HEADER.size))
+
+    store = DurableQueue(str(tmp_path))
+    assert drain(store) == [{"id": 0}, {"id": 1}]
+    store.put({"id": 3})
+    assert drain(store) == [{"id": 3}]
+    store.close()
+
+
+def test_truncated_segment(tmp_path):
+    segment, record = write_three(str(tmp_path))
+    with open(segment, "r+b") as f:
+        f.truncate(2 * record + RECORD_HEADER.size + 2)
+
+    store = DurableQueue(str(tmp_path))
+    assert drain(store) == [{"id": 0}, {"id": 1}]
+    store.close()